@@ -0,0 +1,245 @@
+# ---------------------------------------------------------------------------------------------------
+# Backfills that survive interruptions. The games to scrape are listed in a manifest on disk with the
+# status of each game: pending, claimed, fetched, transformed or failed. Worker processes, on this
+# machine or on others sharing the folder, claim a few games at a time under a file lock, fetch and
+# transform them and write them to the output store. A game whose worker stopped before it was
+# transformed is claimed again as soon as its process is found to be gone on the same machine, or once
+# its lease runs out for a worker on another machine, so a restarted backfill resumes where it stopped.
+#
+#   python pbp.py --start 2010 --end 2024 --backfill --workers 4     start or resume a backfill
+#   python backfill.py --output nhl_data --workers 4                  join it from another machine
+# ---------------------------------------------------------------------------------------------------
+import argparse
+import fcntl
+import json
+import os
+import pickle
+import socket
+import sys
+import time
+from contextlib import contextmanager
+
+from fileio import atomic_write
+
+# Games claimed by a worker at once, and the seconds before a claim by a stopped worker runs out
+batch_games = int(os.environ.get('NHL_BACKFILL_BATCH', 20))
+lease_seconds = int(os.environ.get('NHL_BACKFILL_LEASE', 30 * 60))
+
+statuses = ['pending', 'claimed', 'fetched', 'transformed', 'failed']
+
+
+def backfill_dir(output_dir):
+    return os.path.join(output_dir, 'backfill')
+
+
+def manifest_path(output_dir):
+    return os.path.join(backfill_dir(output_dir), 'manifest.json')
+
+
+def maps_path(output_dir):
+    return os.path.join(backfill_dir(output_dir), 'maps.pkl')
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+@contextmanager
+def locked(path):
+    # Exclusive lock held by one process at a time, across machines when the file system supports it
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+@contextmanager
+def update_manifest(path):
+    # Read, change and save the manifest while holding its lock
+    with locked(path):
+        manifest = load_manifest(path)
+        yield manifest
+        atomic_write(path, manifest, dump=json.dump)
+
+
+def create(game_ids, path):
+    # Add new games to the manifest as pending, games that failed on an earlier run are tried again
+    with update_manifest(path) as manifest:
+        for Game in game_ids:
+            game = manifest.setdefault(str(Game), {'status': 'pending'})
+            if game['status'] == 'failed':
+                manifest[str(Game)] = {'status': 'pending'}
+
+
+def stopped(worker):
+    # True when the worker ran on this machine and its process is gone. Workers on other machines
+    # cannot be checked, their games wait for the lease to run out
+    host, pid = worker.rsplit(':', 1)
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def claim(path, worker, n=batch_games):
+    # Claim up to n games, pending games first and then games held by a worker whose lease ran out or
+    # whose process on this machine is gone
+    now = time.time()
+    with update_manifest(path) as manifest:
+        expired = [Game for Game, game in manifest.items()
+                   if game['status'] in ('claimed', 'fetched')
+                   and (game['time'] + lease_seconds < now or stopped(game['worker']))]
+        pending = [Game for Game, game in manifest.items() if game['status'] == 'pending']
+
+        claimed = (pending + expired)[:n]
+        for Game in claimed:
+            manifest[Game] = {'status': 'claimed', 'worker': worker, 'time': now}
+    return [int(Game) for Game in claimed]
+
+
+def mark(path, game_ids, status, worker, error=None):
+    # Record the new status of the games, refreshing the lease of games still being worked on
+    now = time.time()
+    with update_manifest(path) as manifest:
+        for Game in game_ids:
+            game = {'status': status, 'worker': worker, 'time': now}
+            if error is not None:
+                game['error'] = error
+            manifest[str(Game)] = game
+
+
+def progress(path):
+    # Number of games with each status
+    counts = dict.fromkeys(statuses, 0)
+    for game in load_manifest(path).values():
+        counts[game['status']] += 1
+    return counts
+
+
+def failed(path):
+    return sorted(int(Game) for Game, game in load_manifest(path).items() if game['status'] == 'failed')
+
+
+# ---------------------------------------------------------------------------------------------------
+
+def save_maps(schedule_map, player_map, goalie_id, output_dir, player_ids=False, describe_events=None):
+    # Maps every worker needs, saved once by the process that starts the backfill
+    maps = {'schedule_map': schedule_map, 'player_map': player_map, 'goalie_id': goalie_id,
+            'player_ids': player_ids, 'describe_events': describe_events}
+    os.makedirs(backfill_dir(output_dir), exist_ok=True)
+    atomic_write(maps_path(output_dir), maps, 'wb', pickle.dump)
+
+
+def load_maps(output_dir):
+    with open(maps_path(output_dir), 'rb') as f:
+        return pickle.load(f)
+
+
+def _write(final_pbp, shifts, output_dir):
+    # Workers rewrite partitions other workers also write to, so only one writes at a time
+    import pandas as pd
+    import store
+
+    with locked(os.path.join(backfill_dir(output_dir), 'store')):
+        store.write(pd.concat(final_pbp, ignore_index=True), 'final_pbp', output_dir)
+        store.write(store.add_partitions(pd.concat(shifts, ignore_index=True)), 'shifts', output_dir)
+
+
+def _run_batch(game_ids, maps, output_dir, path, worker, session):
+    from stream import iter_games, process_game
+
+    # Games missing from the responses failed every attempt, see fetch.failures
+    games = list(iter_games(game_ids, session))
+    fetched = [Game for Game, _, _ in games]
+    mark(path, [Game for Game in game_ids if Game not in fetched], 'failed', worker, 'request failed')
+    mark(path, fetched, 'fetched', worker)
+
+    batch_pbp = []
+    batch_shifts = []
+    for Game, data_game, data_shift in games:
+        final_pbp, shifts = process_game(Game, data_game, data_shift, maps['schedule_map'], maps['player_map'],
+                                         maps['goalie_id'], maps['player_ids'], maps['describe_events'])
+        if final_pbp is not None:
+            batch_pbp.append(final_pbp)
+            batch_shifts.append(shifts)
+
+    if batch_pbp:
+        _write(batch_pbp, batch_shifts, output_dir)
+    mark(path, fetched, 'transformed', worker)
+
+
+def work(output_dir):
+    # Claim, fetch, transform and write games until none are left, returns the number of games claimed
+    from fetch import make_session
+
+    path = manifest_path(output_dir)
+    maps = load_maps(output_dir)
+    session = make_session()
+    worker = worker_name()
+    claimed = 0
+
+    while True:
+        game_ids = claim(path, worker)
+        if not game_ids:
+            return claimed
+        claimed += len(game_ids)
+        try:
+            _run_batch(game_ids, maps, output_dir, path, worker, session)
+        except Exception as error:
+            # The rest of the games are still worked on, the failed batch is tried again on the next run
+            done = {Game for Game, game in load_manifest(path).items() if game['status'] == 'transformed'}
+            mark(path, [Game for Game in game_ids if str(Game) not in done], 'failed', worker, repr(error))
+
+
+def run(output_dir, workers=1):
+    # Work on the backfill in this process or in several worker processes, returns the progress
+    if workers > 1:
+        from multiprocessing import Process
+
+        processes = [Process(target=work, args=(output_dir,)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    else:
+        work(output_dir)
+    return progress(manifest_path(output_dir))
+
+
+def start(game_ids, schedule_map, player_map, goalie_id, output_dir, workers=1, player_ids=False,
+          describe_events=None):
+    # Start a backfill of the games, or resume the backfill already in the output folder
+    save_maps(schedule_map, player_map, goalie_id, output_dir, player_ids, describe_events)
+    create(game_ids, manifest_path(output_dir))
+    return run(output_dir, workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Join a backfill started with pbp.py --backfill.')
+    parser.add_argument('--output', default='nhl_data', help='folder of the backfill, shared by every worker')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes started on this machine')
+    parser.add_argument('--status', action='store_true', help='only print the number of games with each status')
+    args = parser.parse_args(argv)
+
+    counts = progress(manifest_path(args.output)) if args.status else run(args.output, args.workers)
+    print(', '.join(f'{count} {status}' for status, count in counts.items()))
+    return counts
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,167 @@
+# ---------------------------------------------------------------------------------------------------
+# Offline benchmark of the transformation. Synthetic API payloads are generated for a number of games
+# and every stage of the pipeline is timed on its own, so changes to one stage can be measured without
+# requests to the NHL API. Tracing the memory allocated by each stage slows the stages down, so it is
+# only done with --memory. Each number of games runs in a new process, so the peak resident memory
+# reported is the peak of that run alone.
+#
+#   python benchmark.py --games 1 100 1300 --events 300 --shifts 12 --output benchmark.json
+# ---------------------------------------------------------------------------------------------------
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import synthetic
+from on_ice import assign_on_ice
+from transform import (normalize_roster, build_players, normalize_schedule, build_schedule, normalize_game,
+                       normalize_shifts, build_player_map, goalie_ids, transform_pbp, transform_shifts,
+                       build_full_pbp, describe, finalize, compact_dtypes, memory_report)
+
+season = 20232024
+
+# Trace the peak memory allocated by each stage
+trace_memory = False
+
+
+def payloads(games, events, shifts_per_player, seed):
+    # Rosters, schedule and the play-by-play and shifts of every game, as returned by the API
+    rosters = [(triCode, synthetic.roster(team_id, triCode, seed)) for team_id, triCode in synthetic.teams]
+    data_schedule = synthetic.schedule(season, games, seed)
+
+    data_games = []
+    for data_game in data_schedule['games']:
+        home = (data_game['homeTeam']['id'], data_game['homeTeam']['abbrev'])
+        away = (data_game['awayTeam']['id'], data_game['awayTeam']['abbrev'])
+        data_games.append((data_game['id'],
+                           synthetic.game(data_game['id'], home, away, events, seed),
+                           synthetic.shifts(data_game['id'], home, away, shifts_per_player, seed)))
+    return rosters, data_schedule, data_games
+
+
+def timed(stages, name, rows, func, *args):
+    # Run one stage and record its wall time, throughput and the peak memory it allocated
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+
+    stage = {
+        'stage': name,
+        'seconds': round(seconds, 4),
+        'rows': rows,
+        'rows_per_second': round(rows / seconds) if seconds > 0 else None,
+    }
+    if trace_memory:
+        stage['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+
+    stages.append(stage)
+    return result
+
+
+def peak_rss_mb():
+    # Peak resident memory of the process, reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 1)
+
+
+def normalize(data_games):
+    pbp = pd.concat([normalize_game(Game, data_game) for Game, data_game, _ in data_games], ignore_index=True)
+    pbp['season'] = pbp['season'].astype(int)
+    shifts = pd.concat([normalize_shifts(data_shift) for _, _, data_shift in data_games], ignore_index=True)
+    return pbp, shifts
+
+
+def maps(rosters, data_schedule):
+    Players = build_players([normalize_roster(data_roster, triCode, season) for triCode, data_roster in rosters])
+    schedule_map = build_schedule([normalize_schedule(data_schedule)]).set_index('id')
+    player_map = build_player_map(Players)
+    return schedule_map, player_map, goalie_ids(player_map)
+
+
+def run(games, events=300, shifts_per_player=12, seed=0, describe_events=None, player_ids=False):
+    # Time every stage of the transformation for a number of synthetic games
+    rosters, data_schedule, data_games = payloads(games, events, shifts_per_player, seed)
+    stages = []
+
+    rows = sum(len(data_game['plays']) for _, data_game, _ in data_games)
+    pbp, shifts = timed(stages, 'normalize', rows, normalize, data_games)
+    del data_games
+
+    schedule_map, player_map, goalie_id = timed(stages, 'maps', len(rosters), maps, rosters, data_schedule)
+    pbp_transform = timed(stages, 'transform_pbp', rows, transform_pbp, pbp, schedule_map, player_map)
+    shifts = timed(stages, 'transform_shifts', len(shifts), transform_shifts, shifts, player_map)
+    on_ice_df = timed(stages, 'on_ice', rows, assign_on_ice, pbp_transform, shifts, goalie_id, player_ids)
+    full_pbp = timed(stages, 'full_pbp', rows, build_full_pbp, pbp_transform, on_ice_df)
+    full_pbp = timed(stages, 'describe', rows, describe, full_pbp, describe_events)
+    final_pbp = timed(stages, 'finalize', rows, finalize, full_pbp, player_ids, False)
+    compact_pbp = timed(stages, 'compact', rows, compact_dtypes, final_pbp)
+    memory = memory_report(final_pbp, compact_pbp).loc['total']
+
+    seconds = sum(stage['seconds'] for stage in stages)
+    return {
+        'games': games,
+        'events_per_game': events,
+        'shifts_per_player': shifts_per_player,
+        'rows': len(final_pbp),
+        'shift_rows': len(shifts),
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(len(final_pbp) / seconds) if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'final_pbp_mb': round(memory['mb_before'], 1),
+        'compact_pbp_mb': round(memory['mb_after'], 1),
+        'stages': stages,
+    }
+
+
+def run_isolated(games, *args, memory=False):
+    # Same as run in a new process, the peak resident memory of the process then only covers this run
+    # instead of every run before it
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_run_traced, memory, games, *args).result()
+
+
+def _run_traced(memory, *args):
+    global trace_memory
+    trace_memory = memory
+    return run(*args)
+
+
+def print_result(result):
+    print(f"{result['games']} games, {result['rows']} rows, {result['shift_rows']} shifts: "
+          f"{result['seconds']:.2f}s, {result['rows_per_second']} rows/s, peak RSS {result['peak_rss_mb']} MB")
+    print(f"  final_pbp {result['final_pbp_mb']} MB, {result['compact_pbp_mb']} MB with compact types")
+    for stage in result['stages']:
+        peak = f"{stage['peak_mb']:>10.1f} MB" if 'peak_mb' in stage else ''
+        print(f"  {stage['stage']:<18}{stage['seconds']:>10.3f}s{stage['rows_per_second'] or 0:>14} rows/s{peak}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each stage of the play-by-play transformation offline.')
+    parser.add_argument('--games', type=int, nargs='+', default=[1, 100, 1300])
+    parser.add_argument('--events', type=int, default=300, help='events in each game')
+    parser.add_argument('--shifts', type=int, default=12, help='shifts of each skater in each period')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--player-ids', action='store_true', help='keep event and on-ice players as IDs')
+    parser.add_argument('--no-descriptions', action='store_true', help='skip rendering descriptions')
+    parser.add_argument('--memory', action='store_true', help='trace the peak memory allocated by each stage')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for games in args.games:
+        result = run_isolated(games, args.events, args.shifts, args.seed,
+                              [] if args.no_descriptions else None, args.player_ids, memory=args.memory)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,196 @@
+# ---------------------------------------------------------------------------------------------------
+# Local on-disk cache of NHL API responses. Each response is stored under a hash of its url, finished
+# games are kept forever while games in progress and team/roster/schedule data expire after a set
+# time. In offline mode every request is answered from the cache alone.
+# ---------------------------------------------------------------------------------------------------
+import hashlib
+import json
+import os
+import re
+import time
+
+import ratelimit
+from fileio import atomic_write
+
+# Location of the cache and the largest size it is allowed to grow to before old entries are removed
+cache_dir = os.environ.get('NHL_CACHE_DIR', '.nhl_cache')
+max_bytes = int(os.environ.get('NHL_CACHE_MAX_MB', 4096)) * 1024 * 1024
+
+# Seconds between two walks of the cache to evict old entries, the first request batch of a run always
+# checks the size
+evict_interval = int(os.environ.get('NHL_CACHE_EVICT_SECONDS', 15 * 60))
+_last_evict = None
+
+# Turn the cache off completely, or run without the network using only what has been cached
+use_cache = os.environ.get('NHL_CACHE', '1') != '0'
+offline = os.environ.get('NHL_OFFLINE', '0') == '1'
+
+# Seconds before a cached response is requested again, None means the response never expires
+live_ttl = 60
+metadata_ttl = 24 * 60 * 60
+
+# Game states returned by the play-by-play endpoint once a game is complete
+final_states = ['FINAL', 'OFF']
+
+# Only successful responses and responses for team-seasons that do not exist are cached
+cache_status = [200, 404]
+
+game_pattern = re.compile(r'gamecenter/(\d+)/play-by-play')
+shift_pattern = re.compile(r'shiftcharts\?cayenneExp=gameId=(\d+)')
+
+
+class CachedResponse:
+    # Stand-in for a requests response built from a cache entry
+
+    def __init__(self, url, status_code, content):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _paths(url):
+    key = _key(url)
+    folder = os.path.join(cache_dir, key[:2])
+    return os.path.join(folder, key + '.body'), os.path.join(folder, key + '.meta')
+
+
+def _read_meta(url):
+    body_path, meta_path = _paths(url)
+    if not (os.path.exists(body_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _final_path(Game):
+    return os.path.join(cache_dir, 'final', str(Game))
+
+
+def _is_final_game(Game):
+    # A game is complete once its play-by-play has been cached with a final game state
+    return os.path.exists(_final_path(Game))
+
+
+def ttl_for(url, status_code, content):
+    # Play-by-play for a finished game never changes, neither do the shifts once the game is final
+    game = game_pattern.search(url)
+    if game:
+        if status_code == 200 and json.loads(content).get('gameState') in final_states:
+            return None
+        return live_ttl
+
+    # The shift chart of a final game can be empty or partial for a while after the game ends, it is
+    # only kept forever once it lists shifts
+    shift = shift_pattern.search(url)
+    if shift:
+        if status_code == 200 and _is_final_game(shift.group(1)) and json.loads(content).get('data'):
+            return None
+        return live_ttl
+
+    return metadata_ttl
+
+
+def load(url):
+    # Return the cached response for the url, stale entries are only returned when offline
+    meta = _read_meta(url)
+    if meta is None:
+        return None
+
+    expires = meta['expires']
+    if not offline and expires is not None and expires < time.time():
+        return None
+
+    body_path, meta_path = _paths(url)
+    with open(body_path, 'rb') as f:
+        content = f.read()
+
+    # Mark the entry as recently used so it is the last to be evicted
+    os.utime(meta_path)
+    return CachedResponse(url, meta['status_code'], content)
+
+
+def store(url, status_code, content):
+    if status_code not in cache_status:
+        return
+
+    ttl = ttl_for(url, status_code, content)
+    meta = {
+        'url': url,
+        'status_code': status_code,
+        'fetched': time.time(),
+        'expires': None if ttl is None else time.time() + ttl,
+    }
+
+    body_path, meta_path = _paths(url)
+    os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+    atomic_write(body_path, content, 'wb')
+    atomic_write(meta_path, json.dumps(meta))
+
+    # Record finished games so their shifts are also kept forever
+    game = game_pattern.search(url)
+    if game and ttl is None:
+        os.makedirs(os.path.dirname(_final_path(game.group(1))), exist_ok=True)
+        open(_final_path(game.group(1)), 'w').close()
+
+
+def get(session, url, request=None):
+    # Answer the request from the cache when possible, otherwise request it and cache the response.
+    # request(session, url) makes the request, by default a plain session.get
+    request = request or (lambda session, url: session.get(url))
+    if not use_cache:
+        return request(session, url)
+
+    cached = load(url)
+    if cached is not None:
+        return cached
+
+    # A url missing from the cache fails like a request that was never answered, the run goes on and
+    # reports the games it belongs to
+    if offline:
+        raise ratelimit.RequestFailed(url, reason='not in the cache and offline mode is on', attempts=0)
+
+    response = request(session, url)
+    store(url, response.status_code, response.content)
+    return response
+
+
+def evict():
+    # Remove the least recently used entries until the cache is back under its size limit. Walking the
+    # cache is slow once it holds a few seasons, so it is done at most once every evict_interval
+    global _last_evict
+    if _last_evict is not None and time.monotonic() - _last_evict < evict_interval:
+        return
+    _last_evict = time.monotonic()
+
+    if not os.path.isdir(cache_dir):
+        return
+
+    entries = []
+    total = 0
+    for folder, _, files in os.walk(cache_dir):
+        for file in files:
+            if not file.endswith('.meta'):
+                continue
+            meta_path = os.path.join(folder, file)
+            body_path = meta_path[:-len('.meta')] + '.body'
+            size = os.path.getsize(meta_path)
+            if os.path.exists(body_path):
+                size += os.path.getsize(body_path)
+            entries.append((os.path.getmtime(meta_path), size, body_path, meta_path))
+            total += size
+
+    for _, size, body_path, meta_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in [body_path, meta_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        total -= size
@@ -0,0 +1,125 @@
+# ---------------------------------------------------------------------------------------------------
+# Description of each event using columns associated with each event type. Descriptions are only
+# rendered for the rows and event types that are asked for, so they can be skipped entirely when
+# exporting in bulk and filled in later for the few rows that are read.
+# ---------------------------------------------------------------------------------------------------
+import string
+
+import numpy as np
+import pandas as pd
+
+# Template for each event type, fields are columns of the play-by-play data
+templates = {
+    # Period Start
+    "PSTR": "Period Start",
+
+    # Faceoff
+    "FAC": ("{event_team} Faceoff won {event_zone}. Zone - {event_team} #{event_player_1_sweater} {event_player_1}"
+            " vs {opp_event_team} #{event_player_2_sweater} {event_player_2}"),
+
+    # Blocked Shots
+    "BLK": "{opp_event_team} {event_player_2} Shot Blocked By {event_team} {event_player_1}, {event_zone}",
+
+    # Penalty
+    "PEN": ("{event_team} #{event_player_1_sweater} {event_player_1} {penalty_type} - {penalty_duration} min, "
+            "{event_zone}. Zone Drawn By {opp_event_team} #{event_player_2_sweater} {event_player_2}"),
+
+    # Giveaway
+    "GIVE": "{event_team} Giveaway - #{event_player_1_sweater} {event_player_1}, {event_zone}. Zone",
+
+    # Shots
+    "SHOT": "{event_team} SOG - #{event_player_1_sweater} {event_player_1}, {event_zone}. Zone, {shot_distance}",
+
+    # Takeaway
+    "TAKE": "{event_team} Takeaway - #{event_player_1_sweater} {event_player_1}, {event_zone}. Zone",
+
+    # Delayed Penalty
+    "DPEN": "Delayed Penalty",
+
+    # Goal
+    "GOAL": ("{event_team} #{event_player_1_sweater} {event_player_1} {event_detail} Shot, {event_zone}, "
+             "{shot_distance} Assists:{event_player_2} {event_player_3}"),
+
+    # Missed Shots
+    "MISS": ("{event_team} - #{event_player_1_sweater} {event_player_1} {event_detail}, {event_zone}. Zone, "
+             "{shot_distance}"),
+
+    # Period End
+    "PEND": "Period End",
+
+    # Game End
+    "GEND": "Game End",
+
+    # End Shootout
+    "ENDSO": "Shootout Complete",
+
+    # Failed Shot
+    "FSHOT": "Failed Shot",
+
+    # Hits
+    "HIT": ("{event_team} #{event_player_1_sweater} {event_player_1} Hit #{event_player_2_sweater} "
+            "{event_player_2}, {event_zone}. Zone"),
+}
+
+# Columns that are converted to text before they are added to a description
+text_columns = {
+    'event_player_1_sweater': lambda col: col.astype(str),
+    'event_player_2_sweater': lambda col: col.astype(str),
+    'penalty_duration': lambda col: col.astype(str),
+    'shot_distance': lambda col: col.round().astype(str),
+}
+
+# Columns needed to render descriptions after the play-by-play has been finalized
+source_columns = ['event_player_1_sweater', 'event_player_2_sweater', 'penalty_type', 'penalty_duration']
+
+player_name_columns = ['event_player_1', 'event_player_2', 'event_player_3']
+
+
+def _column(frame, field):
+    if field == 'opp_event_team':
+        return pd.Series(np.where(frame['event_team'] == frame['home_team'], frame['away_team'], frame['home_team']),
+                         index=frame.index)
+    col = frame[field]
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        col = col.astype(object)
+    return text_columns[field](col) if field in text_columns else col
+
+
+def render_template(template, frame):
+    # Concatenate the literal text and columns of the template for every row, a missing value in any
+    # column leaves the description missing
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        if literal:
+            parts.append(literal)
+        if field is not None:
+            parts.append(_column(frame, field))
+
+    if not any(isinstance(part, pd.Series) for part in parts):
+        return pd.Series(template, index=frame.index, dtype=object)
+
+    description = parts[0]
+    for part in parts[1:]:
+        description = description + part
+    return description
+
+
+def render(frame, event_types=None, rows=None, player_map=None):
+    # Descriptions for the requested rows and event types, every other row is left missing.
+    # With a player_map, event players stored as player IDs are described by name
+    description = pd.Series(np.nan, index=frame.index, dtype=object)
+    subset = frame if rows is None else frame.loc[rows]
+    event_types = list(templates) if event_types is None else event_types
+
+    if player_map is not None:
+        subset = subset.copy()
+        for col in player_name_columns:
+            if pd.api.types.is_integer_dtype(subset[col]):
+                subset[col] = player_map['PlayerName'].reindex(subset[col]).to_numpy()
+
+    for event_type in event_types:
+        events = subset[subset['event_type'] == event_type]
+        if not events.empty:
+            description.loc[events.index] = render_template(templates[event_type], events)
+
+    return description
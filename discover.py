@@ -0,0 +1,166 @@
+# ---------------------------------------------------------------------------------------------------
+# Discovery of the team-seasons that exist. The team endpoint lists every franchise the league has
+# ever had, so instead of requesting a roster and a schedule for each of them in every season the
+# teams in each season's standings are used. The teams found for each season and the team-seasons of
+# finished seasons the API answered with 404 are kept in an index on disk so later runs do not request
+# them again.
+#
+# The games of each season come from the league schedule, one request for each week of the season
+# instead of one for each club, where every game would be downloaded once for each of its two teams.
+# The game manifest of a finished season is saved next to the index and never requested again.
+# ---------------------------------------------------------------------------------------------------
+import datetime
+import json
+import os
+import threading
+import time
+
+import cache
+from fileio import atomic_write
+from fetch import get, get_many, league_schedule_url, standings_seasons_url, standings_url, succeeded
+
+# Index of the teams found in each season and the team-seasons known not to exist
+index_path = os.path.join(cache.cache_dir, 'team_seasons.json')
+
+# Game manifest of each finished season, built from the league schedule
+schedule_dir = os.path.join(cache.cache_dir, 'schedules')
+
+_lock = threading.Lock()
+
+
+def load_index():
+    if not os.path.exists(index_path):
+        return {'active': {}, 'missing': []}
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def save_index(index):
+    os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+    atomic_write(index_path, index, dump=json.dump)
+
+
+def standings_teams(seasons, session):
+    # Teams in the standings at the end of each season, seasons the standings could not be found for
+    # are left out
+    response = get(session, standings_seasons_url())
+    if response.status_code != 200:
+        return {}
+
+    end_dates = {str(season['id']): season['standingsEnd'] for season in response.json().get('seasons', [])}
+    teams = {}
+    for season in seasons:
+        if season not in end_dates:
+            continue
+        response = get(session, standings_url(end_dates[season]))
+        if response.status_code != 200:
+            continue
+        triCodes = [team['teamAbbrev']['default'] for team in response.json().get('standings', [])]
+        if triCodes:
+            teams[season] = sorted(triCodes)
+    return teams
+
+
+def _weeks(start, end):
+    # First day of every week from start to end, the league schedule returns a week from the date asked
+    start, end = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    return [str(start + datetime.timedelta(days=days)) for days in range(0, (end - start).days + 1, 7)]
+
+
+def _week_games(data_week):
+    # Games of one week in the shape of the club schedule, the date is given once for each day
+    return [{'gameDate': day['date'], **game} for day in data_week.get('gameWeek', []) for game in day.get('games', [])]
+
+
+def season_games(season, start, session):
+    # Games of a season from the league schedule starting on the date given, None unless every week was
+    # found. The first week gives the dates the preseason starts and the playoffs end
+    url = league_schedule_url(start)
+    response = get(session, url)
+    if not succeeded(url, response):
+        return None
+    data_week = response.json()
+    first = data_week.get('preSeasonStartDate') or start
+    last = data_week.get('playoffEndDate') or data_week.get('regularSeasonEndDate')
+    if last is None:
+        return None
+
+    urls = [league_schedule_url(week) for week in _weeks(first, last)]
+    games = {}
+    for url, response in zip(urls, get_many(urls, session)):
+        if not succeeded(url, response):
+            return None
+        games.update((game['id'], game) for game in _week_games(response.json()) if str(game['season']) == season)
+    return list(games.values())
+
+
+def league_schedule(seasons, session):
+    # Games of every season the league schedule could be read for, seasons that are left out have to be
+    # built from the club schedules
+    paths = {season: os.path.join(schedule_dir, f'{season}.json') for season in seasons}
+    schedules = {}
+    for season in seasons:
+        if os.path.exists(paths[season]):
+            with open(paths[season]) as f:
+                schedules[season] = json.load(f)
+
+    unknown = [season for season in seasons if season not in schedules]
+    response = get(session, standings_seasons_url()) if unknown else None
+    if response is None or response.status_code != 200:
+        return schedules
+
+    start_dates = {str(season['id']): season['standingsStart'] for season in response.json().get('seasons', [])}
+    for season in unknown:
+        games = season_games(season, start_dates[season], session) if season in start_dates else None
+        if not games:
+            continue
+        schedules[season] = games
+        if finished(season):
+            os.makedirs(schedule_dir, exist_ok=True)
+            atomic_write(paths[season], games, dump=json.dump)
+    return schedules
+
+
+def team_seasons(seasons, session, all_teams):
+    # (triCode, season) for every team-season that exists. all_teams() returns every triCode and is
+    # only called for seasons that are not in the standings
+    index = load_index()
+    unknown = [season for season in seasons if season not in index['active']]
+
+    if unknown:
+        found = standings_teams(unknown, session)
+        if found:
+            index['active'].update(found)
+            save_index(index)
+
+    missing = {tuple(pair) for pair in index['missing']}
+    season_teams = {}
+    fallback = None
+    for season in seasons:
+        if season not in index['active'] and fallback is None:
+            fallback = all_teams()
+        season_teams[season] = index['active'].get(season, fallback)
+
+    # Ordered by team and then season, the same order as every team crossed with every season
+    triCodes = list(dict.fromkeys(triCode for season in seasons for triCode in season_teams[season]))
+    return [(triCode, season) for triCode in triCodes for season in seasons
+            if triCode in season_teams[season] and (triCode, season) not in missing]
+
+
+def finished(season):
+    # A season is finished once the year it ends in is over, a team-season of the current or a later
+    # season can still be added
+    return int(str(season)[4:]) < time.localtime().tm_year
+
+
+def record_missing(pairs):
+    # Remember team-seasons of finished seasons the API answered with 404 so they are never requested
+    # again, the others are requested on every run
+    pairs = [(triCode, season) for triCode, season in pairs if finished(season)]
+    if not pairs:
+        return
+    with _lock:
+        index = load_index()
+        missing = {tuple(pair) for pair in index['missing']} | set(pairs)
+        index['missing'] = sorted([list(pair) for pair in missing])
+        save_index(index)
@@ -0,0 +1,150 @@
+# ---------------------------------------------------------------------------------------------------
+# Expected goals features. Every unblocked shot attempt gets the context of the event before it in the
+# same period, the score and strength from the point of view of the shooting team and its shot
+# geometry, all computed with grouped shifts over the whole play-by-play at once. The features are
+# saved as the xg_features table of the output store under a feature version, so model training reads
+# them back instead of building them again, and only games that are new or were still in progress are
+# built on each update.
+#
+#   features.update()
+#   shots = features.load(seasons=[20232024])
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+import store
+from geometry import fenwick_shot
+
+# Raise when the features change so stored features of the old version are built again
+feature_version = 2
+
+# Previous shot attempts of the same team within this many seconds make a rebound, previous events in
+# the shooting team's neutral or defensive zone within this many seconds make a rush
+rebound_seconds = 2
+rush_seconds = 4
+shot_attempts = ['SHOT', 'MISS', 'BLK']
+
+# Columns of the final play-by-play the features are built from
+source_columns = [
+    'season', 'season_type', 'game_id', 'event_index', 'game_period', 'game_seconds', 'event_type',
+    'event_detail', 'event_team', 'home_team', 'xC', 'yC', 'home_zone', 'home_skaters', 'away_skaters',
+    'home_score', 'away_score', 'home_goalie', 'away_goalie', 'shot_distance', 'shot_angle', 'shooter_hand',
+    'shooter_pos',
+]
+
+feature_columns = [
+    'season', 'season_type', 'game_id', 'event_index', 'game_period', 'game_seconds', 'event_team', 'is_home',
+    'event_type', 'goal', 'shot_type', 'xC', 'yC', 'shot_distance', 'shot_angle', 'shooter_hand', 'shooter_pos',
+    'own_skaters', 'opposing_skaters', 'strength_state', 'score_diff', 'empty_net', 'prev_event_type',
+    'prev_event_team', 'prev_same_team', 'prev_xC', 'prev_yC', 'seconds_since_last', 'distance_from_last',
+    'speed_from_last', 'angle_change', 'rebound', 'rush', 'complete',
+]
+
+# Zone of the previous event from the point of view of the away team
+_flip_zone = {'Off': 'Def', 'Def': 'Off', 'Neu': 'Neu'}
+
+
+def build(final_pbp):
+    # One row of features for each unblocked shot attempt, shootout attempts are left out
+    pbp = final_pbp[source_columns].sort_values(['game_id', 'game_seconds', 'event_index'])
+
+    # Compact categorical columns have different categories in each column, compare them as text
+    pbp = pbp.astype({col: object for col in pbp if isinstance(pbp[col].dtype, pd.CategoricalDtype)})
+
+    previous = pbp.groupby(['game_id', 'game_period'], sort=False)[
+        ['event_type', 'event_team', 'game_seconds', 'xC', 'yC', 'home_zone', 'shot_angle']].shift(1)
+    complete = pbp['event_type'].eq('GEND').groupby(pbp['game_id']).transform('any')
+
+    shootout = (pbp['season_type'] != 'POST') & (pbp['game_period'] >= 5)
+    shots = pbp['event_type'].isin(fenwick_shot) & ~shootout
+    pbp = pbp[shots]
+    previous = previous[shots]
+
+    is_home = (pbp['event_team'] == pbp['home_team']).to_numpy()
+    goal = (pbp['event_type'] == 'GOAL').to_numpy()
+    home_skaters = pbp['home_skaters'].to_numpy()
+    away_skaters = pbp['away_skaters'].to_numpy()
+    own_skaters = np.where(is_home, home_skaters, away_skaters)
+    opposing_skaters = np.where(is_home, away_skaters, home_skaters)
+
+    # The score of a goal already counts the goal, the score state is the one before the shot
+    home_lead = (pbp['home_score'] - pbp['away_score']).to_numpy()
+    score_diff = np.where(is_home, home_lead, -home_lead) - goal
+
+    seconds = (pbp['game_seconds'] - previous['game_seconds']).to_numpy(dtype=float)
+    distance = np.sqrt((pbp['xC'] - previous['xC'])**2 + (pbp['yC'] - previous['yC'])**2).to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(seconds > 0, distance / seconds, np.nan)
+
+    # A rebound follows an attempt by the same team, the event team of a blocked shot is the team that blocked it
+    prev_home = (previous['event_team'] == pbp['home_team']).to_numpy()
+    prev_shooter_home = np.where(previous['event_type'].eq('BLK').to_numpy(), ~prev_home, prev_home)
+    rebound = (previous['event_type'].isin(shot_attempts).to_numpy() & previous['event_team'].notna().to_numpy()
+               & (prev_shooter_home == is_home) & (seconds <= rebound_seconds))
+    prev_zone = np.where(is_home, previous['home_zone'], previous['home_zone'].map(_flip_zone))
+    rush = pd.Series(prev_zone).isin(['Neu', 'Def']).to_numpy() & (seconds <= rush_seconds)
+
+    features = pd.DataFrame({
+        'season': pbp['season'], 'season_type': pbp['season_type'], 'game_id': pbp['game_id'],
+        'event_index': pbp['event_index'], 'game_period': pbp['game_period'], 'game_seconds': pbp['game_seconds'],
+        'event_team': pbp['event_team'], 'is_home': is_home, 'event_type': pbp['event_type'], 'goal': goal,
+        'shot_type': pbp['event_detail'], 'xC': pbp['xC'], 'yC': pbp['yC'],
+        'shot_distance': pbp['shot_distance'], 'shot_angle': pbp['shot_angle'],
+        'shooter_hand': pbp['shooter_hand'], 'shooter_pos': pbp['shooter_pos'],
+        'own_skaters': own_skaters, 'opposing_skaters': opposing_skaters,
+        'strength_state': pd.Series(own_skaters, index=pbp.index).astype(str) + 'v'
+                          + pd.Series(opposing_skaters, index=pbp.index).astype(str),
+        'score_diff': score_diff,
+        'empty_net': np.where(is_home, pbp['away_goalie'].isna(), pbp['home_goalie'].isna()),
+        'prev_event_type': previous['event_type'], 'prev_event_team': previous['event_team'],
+        'prev_same_team': (previous['event_team'] == pbp['event_team']).to_numpy(),
+        'prev_xC': previous['xC'], 'prev_yC': previous['yC'],
+        'seconds_since_last': seconds, 'distance_from_last': distance, 'speed_from_last': speed,
+        'angle_change': np.where(rebound, np.abs(pbp['shot_angle'] - previous['shot_angle']), np.nan),
+        'rebound': rebound, 'rush': rush, 'complete': complete[shots].to_numpy(),
+    })
+    return features.reset_index(drop=True)
+
+
+def _stored_complete(season, root=None):
+    # Games whose features were built once the game was complete, at the current feature version
+    stored = store.read('xg_features', columns=['game_id', 'complete'],
+                        filters=[('feature_version', '=', feature_version), ('season', '=', int(season))], root=root)
+    if stored is None:
+        return set()
+    return set(stored.loc[stored['complete'], 'game_id'].unique())
+
+
+def update(seasons=None, root=None):
+    # Build and save the features of every stored game that has none yet, returns the number of shots built
+    if seasons is None:
+        stored = store.read('final_pbp', columns=['season'], root=root)
+        seasons = [] if stored is None else sorted(stored['season'].unique())
+
+    rows = 0
+    for season in seasons:
+        game_ids = store.read('final_pbp', columns=['game_id'], filters=[('season', '=', int(season))],
+                              root=root)['game_id'].unique()
+        game_ids = sorted(set(game_ids) - _stored_complete(season, root))
+        if not game_ids:
+            continue
+
+        final_pbp = store.read('final_pbp', columns=source_columns,
+                               filters=[('season', '=', int(season)), ('game_id', 'in', game_ids)], root=root)
+        features = build(final_pbp)
+        features['feature_version'] = feature_version
+        store.write(features, 'xg_features', root)
+        rows += len(features)
+    return rows
+
+
+def load(seasons=None, root=None):
+    # Features at the current version, brought up to date with the stored play-by-play first
+    update(seasons, root)
+    filters = [('feature_version', '=', feature_version)]
+    if seasons is not None:
+        filters.append(('season', 'in', [int(season) for season in seasons]))
+    features = store.read('xg_features', filters=filters, root=root)
+    if features is None:
+        return pd.DataFrame(columns=feature_columns)
+    return features[feature_columns].sort_values(['game_id', 'game_seconds', 'event_index'], ignore_index=True)
@@ -0,0 +1,176 @@
+# ---------------------------------------------------------------------------------------------------
+# Fetch layer for the NHL API. All requests share one pooled session and run on a bounded pool of
+# worker threads so the play-by-play and shift endpoints for a full season download concurrently.
+# Requests go through the scheduler in ratelimit.py, requests that fail every attempt are kept in
+# failures so the games they belong to can be reported instead of going missing.
+# ---------------------------------------------------------------------------------------------------
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests as req
+from requests.adapters import HTTPAdapter
+
+import cache
+import ratelimit
+import report
+
+# Base URLs of the two NHL APIs, these can be pointed at a local stand-in server for testing
+web_api = os.environ.get('NHL_WEB_API', 'https://api-web.nhle.com/v1')
+stats_api = os.environ.get('NHL_STATS_API', 'https://api.nhle.com/stats/rest/en')
+
+# Number of requests that are allowed to run at the same time
+max_workers = int(os.environ.get('NHL_MAX_WORKERS', 16))
+
+# Roster and schedule urls, to find the team-season of a failed request
+roster_pattern = re.compile(r'roster/(\w+)/(\d+)')
+schedule_pattern = re.compile(r'club-schedule-season/(\w+)/(\d+)')
+
+# Urls that failed every attempt and the reason they failed
+failures = {}
+_failures_lock = threading.Lock()
+
+
+class FailedResponse:
+    # Stand-in for a request that failed every attempt, reading it raises the failure
+
+    def __init__(self, error):
+        self.url = error.url
+        self.status_code = error.status_code
+        self.content = b''
+        self.error = error
+
+    def json(self):
+        raise self.error
+
+
+def make_session(workers=None):
+    # Keep one connection open per worker so connections are reused between requests
+    workers = workers or max_workers
+    session = req.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get(session, url):
+    # Single request, answered from the local cache when the response is still fresh
+    try:
+        response = cache.get(session, url, ratelimit.request)
+    except ratelimit.RequestFailed as error:
+        record_failure(url, str(error))
+        response = FailedResponse(error)
+        report.record_request(response, failed=True)
+        return response
+
+    report.record_request(response, isinstance(response, cache.CachedResponse))
+    return response
+
+
+def record_failure(url, reason):
+    with _failures_lock:
+        failures[url] = reason
+
+
+def succeeded(url, response):
+    # True when the response holds the data, any other answer such as a 404 for a game is kept in
+    # failures like a request that failed every attempt
+    if response.status_code == 200:
+        return True
+    if not isinstance(response, FailedResponse):
+        record_failure(url, f'{url} returned {response.status_code}')
+    return False
+
+
+def failed_pairs():
+    # (triCode, season) with a roster or schedule request that failed every attempt
+    pairs = set()
+    for url in list(failures):
+        match = roster_pattern.search(url) or schedule_pattern.search(url)
+        if match:
+            pairs.add((match.group(1), match.group(2)))
+    return pairs
+
+
+def failed_games(schedule=None):
+    # Game IDs with a play-by-play or shift request that failed. With the schedule, the games of every
+    # team-season whose roster or schedule failed are included too, their players would be missing
+    games = set()
+    for url in list(failures):
+        match = cache.game_pattern.search(url) or cache.shift_pattern.search(url)
+        if match:
+            games.add(int(match.group(1)))
+
+    pairs = failed_pairs()
+    if schedule is not None and pairs:
+        seasons = [f'{year}{year + 1}' for year in schedule['id'] // 1000000]
+        affected = [(home, season) in pairs or (away, season) in pairs for home, away, season
+                    in zip(schedule['homeTeam.abbrev'], schedule['awayTeam.abbrev'], seasons)]
+        games.update(schedule.loc[affected, 'id'].astype(int))
+    return sorted(games)
+
+
+def get_many(urls, session=None, workers=None):
+    # Request every url using the worker pool, responses are returned in the same order as the urls
+    workers = workers or max_workers
+    session = session or make_session(workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        responses = list(pool.map(lambda url: get(session, url), urls))
+
+    cache.evict()
+    return responses
+
+
+def iter_many(urls, session=None, workers=None):
+    # Same as get_many but responses are yielded in order as soon as they arrive, only a small window
+    # of requests is in flight at once so memory does not grow with the number of urls
+    workers = workers or max_workers
+    session = session or make_session(workers)
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for url in urls:
+            pending.append(pool.submit(get, session, url))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    cache.evict()
+
+
+# Urls for each of the endpoints used to build the play-by-play data
+def teams_url():
+    return f'{stats_api}/team'
+
+
+def standings_seasons_url():
+    return f'{web_api}/standings-season'
+
+
+def standings_url(date):
+    return f'{web_api}/standings/{date}'
+
+
+def roster_url(triCode, season):
+    return f'{web_api}/roster/{triCode}/{season}'
+
+
+def league_schedule_url(date):
+    return f'{web_api}/schedule/{date}'
+
+
+def schedule_url(triCode, season):
+    return f'{web_api}/club-schedule-season/{triCode}/{season}'
+
+
+def game_url(Game):
+    return f'{web_api}/gamecenter/{Game}/play-by-play'
+
+
+def shift_url(Game):
+    return f'{stats_api}/shiftcharts?cayenneExp=gameId={Game}'
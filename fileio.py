@@ -0,0 +1,20 @@
+# ---------------------------------------------------------------------------------------------------
+# Helpers for the files kept on disk next to the data, the response cache, the team-season index, the
+# backfill manifest and the shift store. Each file is written to a temporary file first and moved into
+# place, so a crash or another process reading at the same time never sees a partial file.
+# ---------------------------------------------------------------------------------------------------
+import os
+import socket
+import threading
+
+
+def atomic_write(path, data, mode='w', dump=None):
+    # Write data, or dump(data, f) when dump is given. The temporary name is unique to the machine,
+    # process and thread writing it, so writers sharing a folder never collide
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, mode) as f:
+        if dump is None:
+            f.write(data)
+        else:
+            dump(data, f)
+    os.replace(tmp_path, path)
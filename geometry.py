@@ -0,0 +1,67 @@
+# ---------------------------------------------------------------------------------------------------
+# Rink geometry for shots and zones. Coordinates are flipped once so the event team always attacks
+# the net at x = 89, after which distance and angle are a single formula for every shot, including
+# shots from beyond center ice and from behind the goal.
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+
+# x coordinate of the net being attacked and of the blue lines
+net_x = 89
+blue_line_x = 25
+
+fenwick_shot = ['SHOT', 'MISS', 'GOAL']
+
+
+def attacking_direction(is_home, defending_left):
+    # +1 when the event team attacks toward positive x, -1 when it attacks toward negative x.
+    # The home team attacks positive x when it defends the left side, the away team the opposite
+    return np.where(np.asarray(is_home) == np.asarray(defending_left), 1, -1)
+
+
+def shot_distance_angle(x, y):
+    # Distance and angle from the net for coordinates already normalized to the attacking direction
+    distance = np.sqrt((net_x - x)**2 + y**2)
+
+    # Shots on the goal line give a 90 degree angle
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angle = np.arctan(np.abs(y)/np.abs(net_x - x)) * (180/np.pi)
+    return distance, angle
+
+
+def add_shot_geometry(pbp_transform):
+    # Limit shot adjustments to only fenwick shots and where x and y coordinates are not missing.
+    # NHL tracks shots at the location they are blocked and not at the location of the shot
+    valid_shot = (
+        pbp_transform['xC'].notna() &
+        pbp_transform['yC'].notna() &
+        pbp_transform['event_type'].isin(fenwick_shot)
+    ).to_numpy()
+
+    shots = pbp_transform.loc[valid_shot]
+    direction = attacking_direction(
+        shots['event_team'] == shots['home_team'],
+        shots['homeTeamDefendingSide'] == "left"
+    )
+    x = shots['xC'].to_numpy(dtype=float) * direction
+    y = shots['yC'].to_numpy(dtype=float)
+    distance, angle = shot_distance_angle(x, y)
+
+    shot_distance = np.full(len(pbp_transform), np.nan)
+    shot_angle = np.full(len(pbp_transform), np.nan)
+    shot_distance[valid_shot] = distance
+    shot_angle[valid_shot] = angle
+
+    pbp_transform['shot_distance'] = shot_distance.round(2)
+    pbp_transform['shot_angle'] = shot_angle.round(2)
+    return pbp_transform
+
+
+def home_zone(defending_side, xC):
+    # Zone of the event from the point of view of the home team
+    home_x = np.where(defending_side == "left", 1.0, np.where(defending_side == "right", -1.0, np.nan)) * xC
+
+    return np.select(
+        [home_x < -blue_line_x, (home_x >= -blue_line_x) & (home_x <= blue_line_x), home_x > blue_line_x],
+        ["Def", "Neu", "Off"],
+        default=np.nan
+    )
@@ -0,0 +1,39 @@
+# ---------------------------------------------------------------------------------------------------
+# Incremental updates of the play-by-play data. The previously produced final_pbp is loaded and only
+# games that are new, or were still in progress when they were last stored, are scraped again.
+# ---------------------------------------------------------------------------------------------------
+import pandas as pd
+
+import store
+
+# Game states in the schedule for games that have not started yet and have nothing to scrape
+future_states = ['FUT', 'PRE']
+
+# Share of a game's events that must have players on the ice for the game to count as complete, games
+# stored before their shifts were published have none
+min_on_ice_share = 0.5
+
+
+def load_previous(seasons, root=None):
+    # Load the games stored by the last run for the seasons being updated, only the columns needed to
+    # tell which games are complete are read. An empty frame is returned on the first run
+    columns = ['game_id', 'event_type', 'home_on_1', 'away_on_1']
+    previous = store.read('final_pbp', columns=columns,
+                          filters=[('season', 'in', [int(season) for season in seasons])], root=root)
+    if previous is None:
+        return pd.DataFrame(columns=columns)
+    return previous
+
+
+def complete_games(previous):
+    # A stored game is only complete once its game end event has been recorded and most of its events
+    # have players on the ice
+    ended = previous['event_type'].eq('GEND').groupby(previous['game_id']).any()
+    on_ice = (previous['home_on_1'].notna() & previous['away_on_1'].notna()).groupby(previous['game_id']).mean()
+    return set(ended.index[ended & (on_ice.reindex(ended.index) >= min_on_ice_share)])
+
+
+def games_to_update(schedule, previous):
+    # Games from the schedule that have started and are not already stored in full
+    started = schedule[~schedule['gameState'].isin(future_states)]
+    return started.loc[~started['id'].isin(complete_games(previous)), 'id'].tolist()
@@ -0,0 +1,245 @@
+# ---------------------------------------------------------------------------------------------------
+# Live mode for games in progress. The play-by-play and shift chart of each game are polled, only plays
+# with an eventId not seen before are parsed and only new or changed shifts are transformed. Players on
+# the ice are assigned again only from the first event a new play or shift can change, and each poll
+# gives the rows of the final play-by-play that are new or changed since the last poll, including
+# events corrected by shifts that arrived late.
+#
+#   python live.py 2024020123 2024020124 --interval 10 --output nhl_data/live
+#
+# Point NHL_WEB_API and NHL_STATS_API at the server in replay.py to run against a recorded game.
+# ---------------------------------------------------------------------------------------------------
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import ratelimit
+import report
+from cache import final_states
+from fetch import make_session, game_url, shift_url
+from on_ice import assign_on_ice, cols_keep
+from parse import loads, columns, play_fields, parse_shifts
+from transform import (transform_pbp, transform_shifts, build_full_pbp, describe, finalize, build_player_map,
+                       goalie_ids)
+
+# Seconds between polls of each game
+poll_seconds = float(os.environ.get('NHL_LIVE_POLL', 10))
+
+on_ice_cols = [col for col in cols_keep if col not in ('game_id', 'game_period', 'game_seconds', 'event_index')]
+key_cols = ['game_id', 'game_period', 'game_seconds', 'event_index']
+
+
+class LiveGame:
+    # Everything seen of one game so far, update() takes the latest payloads and returns the delta rows
+
+    def __init__(self, game_id, schedule_map, player_map, goalie_id, player_ids=False, describe_events=None):
+        self.game_id = game_id
+        self.schedule_map = schedule_map
+        self.player_map = player_map
+        self.goalie_id = goalie_id
+        self.player_ids = player_ids
+        self.describe_events = describe_events
+
+        self.state = None
+        self.event_ids = set()
+        self.plays = None
+        self.shift_records = {}
+        self.shifts = None
+        self.on_ice = None
+        self.final_pbp = None
+
+    @property
+    def final(self):
+        return self.state in final_states
+
+    def add_plays(self, data_game):
+        # Parse the plays not seen before, returns the sortOrder of the first one
+        self.state = data_game.get('gameState')
+        new = [play for play in data_game.get('plays', []) if play['eventId'] not in self.event_ids]
+        if not new:
+            return None
+
+        plays = columns(new, play_fields)
+        plays['eventId'] = [play['eventId'] for play in new]
+        plays['sortOrder'] = [play.get('sortOrder', play['eventId']) for play in new]
+        plays['game_id'] = self.game_id
+        start_year = int(str(self.game_id)[:4])
+        plays['season'] = int(f'{start_year}{start_year+1}')
+
+        self.plays = pd.concat([self.plays, plays], ignore_index=True) if self.plays is not None else plays
+        self.plays = self.plays.sort_values('sortOrder', kind='stable', ignore_index=True)
+        self.event_ids.update(plays['eventId'])
+        return plays['sortOrder'].min()
+
+    def add_shifts(self, data_shift):
+        # Keep the shifts of the latest shift chart, only the shifts that are new or changed are transformed
+        # and shifts the NHL removed are dropped. Returns the earliest game second they cover
+        current = {shift['id']: shift for shift in data_shift.get('data', [])}
+        records = [shift for shift_id, shift in current.items() if self.shift_records.get(shift_id) != shift]
+        removed = [shift_id for shift_id in self.shift_records if shift_id not in current]
+
+        # Events seen before the first shift is listed have nobody on the ice yet
+        if self.shifts is None:
+            self.shifts = transform_shifts(parse_shifts({'data': []}), self.player_map)
+        if not records and not removed:
+            return None
+
+        shifts = transform_shifts(parse_shifts({'data': records}), self.player_map)
+        replaced = self.shifts['id'].isin(shifts['id']) | self.shifts['id'].isin(removed)
+
+        # A changed shift can move its start, events from the earlier of the two starts can change
+        first = pd.concat([shifts['globalStartTime'], self.shifts.loc[replaced, 'globalStartTime']]).min()
+        shifts = pd.concat([self.shifts[~replaced], shifts], ignore_index=True)
+
+        # Players are listed in the order of the shift chart, like a batch run of the finished game
+        order = pd.Series(np.arange(len(current)), index=list(current))
+        self.shifts = shifts.iloc[np.argsort(shifts['id'].map(order).to_numpy(), kind='stable')].reset_index(drop=True)
+        self.shift_records = current
+        return first
+
+    def _assign_on_ice(self, pbp_transform, first_play, first_shift):
+        # Assign the players on the ice from the first event that can have changed to the last event.
+        # The event before a new play is included, whether it stops play depends on the next event
+        starts = []
+        if first_play is not None:
+            starts.append(max(int((pbp_transform['sortOrder'] >= first_play).to_numpy().argmax()) - 1, 0))
+        if first_shift is not None:
+            later = (pbp_transform['game_seconds'] >= first_shift).to_numpy()
+            starts.append(int(later.argmax()) if later.any() else len(pbp_transform))
+        window = pbp_transform.iloc[min(starts):]
+
+        on_ice = assign_on_ice(window, self.shifts, self.goalie_id, self.player_ids)
+        on_ice = on_ice.set_index(window.loc[on_ice.index, 'eventId'])[on_ice_cols]
+        if self.on_ice is not None:
+            on_ice = pd.concat([self.on_ice[~self.on_ice.index.isin(window['eventId'])], on_ice])
+        self.on_ice = on_ice
+
+        return pbp_transform[key_cols + ['eventId']].join(self.on_ice, on='eventId', how='inner')[cols_keep]
+
+    def update(self, data_game, data_shift):
+        # Rows of the final play-by-play that are new or changed since the last update
+        first_play = self.add_plays(data_game)
+        first_shift = self.add_shifts(data_shift)
+        if self.plays is None or (first_play is None and first_shift is None):
+            return self.final_pbp.iloc[:0] if self.final_pbp is not None else pd.DataFrame()
+
+        pbp_transform = transform_pbp(self.plays, self.schedule_map, self.player_map)
+        on_ice_df = self._assign_on_ice(pbp_transform, first_play, first_shift)
+        full_pbp = describe(build_full_pbp(pbp_transform, on_ice_df), self.describe_events)
+        final_pbp = finalize(full_pbp, self.player_ids).reset_index(drop=True)
+
+        delta = changed_rows(final_pbp, self.final_pbp)
+        self.final_pbp = final_pbp
+        return delta
+
+
+def changed_rows(current, previous):
+    # Rows of current that are not in previous or hold different values, matched on the event index.
+    # The categories of a column change between polls, categorical columns are compared as values
+    if previous is None:
+        return current
+    before = _values(previous).set_index('event_index').reindex(current['event_index'])
+    after = _values(current).set_index('event_index')
+    same = (after == before).fillna(False) | (after.isna() & before.isna())
+    return current[~same.all(axis=1).to_numpy()]
+
+
+def _values(final_pbp):
+    return final_pbp.astype({col: object for col in final_pbp if isinstance(final_pbp[col].dtype, pd.CategoricalDtype)})
+
+
+def schedule_row(data_game):
+    # Schedule map of a single game from its own play-by-play payload
+    return pd.DataFrame([{
+        'id': data_game['id'], 'gameType': data_game['gameType'], 'gameDate': data_game['gameDate'],
+        'homeTeam.id': data_game['homeTeam']['id'], 'homeTeam.abbrev': data_game['homeTeam']['abbrev'],
+        'awayTeam.id': data_game['awayTeam']['id'], 'awayTeam.abbrev': data_game['awayTeam']['abbrev'],
+    }]).set_index('id')
+
+
+def get_json(session, url):
+    # Live requests skip the cache so every poll sees the latest data, None when the request failed
+    try:
+        response = ratelimit.request(session, url)
+    except ratelimit.RequestFailed:
+        return None
+    return loads(response.content) if response.status_code == 200 else None
+
+
+def start_game(Game, session, player_ids=False, describe_events=None):
+    # Rosters of both teams of the game, found from the first poll of its play-by-play
+    from pbp import fetch_rosters
+
+    data_game = get_json(session, game_url(Game))
+    if data_game is None:
+        return None, None
+    schedule_map = schedule_row(data_game)
+    season = str(data_game['season'])
+    Players = fetch_rosters([(data_game['homeTeam']['abbrev'], season), (data_game['awayTeam']['abbrev'], season)],
+                            session)
+    player_map = build_player_map(Players)
+    game = LiveGame(Game, schedule_map, player_map, goalie_ids(player_map), player_ids, describe_events)
+    return game, data_game
+
+
+def run(game_ids, on_delta, interval=poll_seconds, session=None, player_ids=False, describe_events=None):
+    # Poll every game until it is final, on_delta(game_id, delta, seconds) is called after every poll
+    # with the new and changed rows and the seconds from the start of the poll
+    session = session or make_session()
+    games = {}
+    pending = {}
+    for Game in game_ids:
+        games[Game], pending[Game] = start_game(Game, session, player_ids, describe_events)
+
+    active = [Game for Game in game_ids if games[Game] is not None]
+    while active:
+        poll_start = time.time()
+        for Game in list(active):
+            started = time.time()
+            data_game = pending.pop(Game, None) or get_json(session, game_url(Game))
+            data_shift = get_json(session, shift_url(Game))
+            if data_game is None or data_shift is None:
+                continue
+
+            with report.stage('live') as stage:
+                delta = games[Game].update(data_game, data_shift)
+                stage['rows'] = len(delta)
+            on_delta(Game, delta, time.time() - started)
+
+            # Shifts can still arrive once the game is over, the game is done after a poll without changes
+            if games[Game].final and delta.empty:
+                active.remove(Game)
+
+        if active:
+            time.sleep(max(interval - (time.time() - poll_start), 0))
+    return {Game: game.final_pbp for Game, game in games.items() if game is not None}
+
+
+def write_delta(output_dir):
+    # on_delta that prints each poll and appends its rows to a CSV file for each game
+    def on_delta(Game, delta, seconds):
+        print(f'{Game}: {len(delta)} new or changed rows in {seconds * 1000:.0f} ms')
+        if output_dir and not delta.empty:
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f'{Game}.csv')
+            delta.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+    return on_delta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Follow games in progress and write the new and changed rows.')
+    parser.add_argument('games', type=int, nargs='+', help='game IDs to follow')
+    parser.add_argument('--interval', type=float, default=poll_seconds, help='seconds between polls of each game')
+    parser.add_argument('--output', help='folder the rows of each poll are appended to, one CSV file per game')
+    parser.add_argument('--player-ids', action='store_true',
+                        help='keep the on-ice and event player columns as player IDs instead of names')
+    args = parser.parse_args(argv)
+    return run(args.games, write_delta(args.output), args.interval, player_ids=args.player_ids)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
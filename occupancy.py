@@ -0,0 +1,125 @@
+# ---------------------------------------------------------------------------------------------------
+# Per-second on-ice occupancy. For each game the shifts are turned once into a game seconds x players
+# matrix of who is on the ice, stored as packed bits so a full season fits in memory or on disk. Time
+# on ice, shared time on ice for any group of players and time on ice at a strength state are then
+# sums over the matrix instead of scans of the shifts.
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+
+class GameOccupancy:
+    # On-ice matrix of one game, second s covers game time s to s + 1
+
+    def __init__(self, game_id, player_ids, teams, is_home, is_goalie, packed):
+        self.game_id = game_id
+        self.player_ids = player_ids
+        self.teams = teams
+        self.is_home = is_home
+        self.is_goalie = is_goalie
+        self.packed = packed
+
+    @property
+    def seconds(self):
+        return self.packed.shape[0]
+
+    @property
+    def matrix(self):
+        # Boolean seconds x players matrix
+        return np.unpackbits(self.packed, axis=1, count=len(self.player_ids)).astype(bool)
+
+    def _columns(self, players):
+        positions = pd.Index(self.player_ids).get_indexer(players)
+        return positions[positions >= 0]
+
+    def skaters(self):
+        # Number of home and away skaters on the ice in each second, goalies are not counted
+        matrix = self.matrix
+        home = matrix[:, self.is_home & ~self.is_goalie].sum(axis=1)
+        away = matrix[:, ~self.is_home & ~self.is_goalie].sum(axis=1)
+        return home, away
+
+    def strength_mask(self, strength):
+        # Seconds x players mask of the seconds where the player's team is at the strength, given from
+        # the point of view of the player's team. '5v4' is a power play for the team with 5 skaters
+        own, opposing = (int(count) for count in strength.split('v'))
+        home, away = self.skaters()
+        home_state = (home == own) & (away == opposing)
+        away_state = (away == own) & (home == opposing)
+        return np.where(self.is_home, home_state[:, None], away_state[:, None])
+
+    def _on_ice(self, strength=None):
+        matrix = self.matrix
+        if strength is not None:
+            matrix = matrix & self.strength_mask(strength)
+        return matrix
+
+    def toi(self, strength=None):
+        # Seconds on the ice for every player of the game
+        return pd.Series(self._on_ice(strength).sum(axis=0), index=pd.Index(self.player_ids, name='playerId'),
+                         name='toi')
+
+    def shared_toi(self, players, strength=None):
+        # Seconds where every one of the players is on the ice together, for a pair or a full line
+        columns = self._columns(players)
+        if len(columns) < len(players):
+            return 0
+        return int(self._on_ice(strength)[:, columns].all(axis=1).sum())
+
+    def pair_toi(self, strength=None):
+        # Seconds every pair of players shares the ice, the diagonal is each player's own time on ice
+        on_ice = self._on_ice(strength).astype(np.int32)
+        index = pd.Index(self.player_ids, name='playerId')
+        return pd.DataFrame(on_ice.T @ on_ice, index=index, columns=index)
+
+
+def build_game(shifts, home_team, goalie_id):
+    # Occupancy of one game from its transformed shifts, each shift covers the seconds from its start
+    # up to but not including its end
+    shifts = shifts[shifts['globalEndTime'] > shifts['globalStartTime']]
+    game_id = int(shifts['gameId'].iloc[0])
+
+    player_ids, columns = np.unique(shifts['playerId'].to_numpy(dtype=np.int64), return_inverse=True)
+    start = shifts['globalStartTime'].to_numpy(dtype=np.int64)
+    end = shifts['globalEndTime'].to_numpy(dtype=np.int64)
+
+    # Mark where each shift starts and ends and add the marks up over the game
+    changes = np.zeros((end.max() + 1, len(player_ids)), dtype=np.int16)
+    np.add.at(changes, (start, columns), 1)
+    np.add.at(changes, (end, columns), -1)
+    on_ice = changes.cumsum(axis=0)[:-1] > 0
+
+    teams = shifts.groupby('playerId')['teamAbbrev'].first().reindex(player_ids).to_numpy(dtype=str)
+    return GameOccupancy(game_id, player_ids, teams, teams == home_team, np.isin(player_ids, goalie_id),
+                         np.packbits(on_ice, axis=1))
+
+
+def build(shifts, schedule_map, goalie_id):
+    # Occupancy of every game in the shifts, keyed by game ID
+    home_teams = schedule_map['homeTeam.abbrev']
+    return {
+        int(game_id): build_game(game_shifts, home_teams[game_id], goalie_id)
+        for game_id, game_shifts in shifts.groupby('gameId', sort=False)
+    }
+
+
+def save(occupancy, path):
+    # Save the occupancy of many games, such as a full season, into one compressed file
+    arrays = {}
+    for game_id, game in occupancy.items():
+        arrays[f'{game_id}/player_ids'] = game.player_ids
+        arrays[f'{game_id}/teams'] = game.teams
+        arrays[f'{game_id}/is_home'] = game.is_home
+        arrays[f'{game_id}/is_goalie'] = game.is_goalie
+        arrays[f'{game_id}/packed'] = game.packed
+    np.savez_compressed(path, **arrays)
+
+
+def load(path):
+    occupancy = {}
+    with np.load(path) as arrays:
+        for game_id in dict.fromkeys(key.split('/')[0] for key in arrays.files):
+            occupancy[int(game_id)] = GameOccupancy(
+                int(game_id), arrays[f'{game_id}/player_ids'], arrays[f'{game_id}/teams'],
+                arrays[f'{game_id}/is_home'], arrays[f'{game_id}/is_goalie'], arrays[f'{game_id}/packed'])
+    return occupancy
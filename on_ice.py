@@ -0,0 +1,146 @@
+# ---------------------------------------------------------------------------------------------------
+# Assign the players that are on the ice for each event. The shifts of each game and period split the
+# period into segments between consecutive shift start and end times, the players on the ice only
+# change at those times. Each shift is listed for the segments it covers, and each event is placed in
+# a segment with np.searchsorted on its game_seconds, so no events x shifts comparison is built.
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+# Events that stop play, players on the ice are the ones whose shift ends at (not starts at) the event
+events_stop = ['GOAL', 'STOP', 'PEN']
+
+# Create the on-ice columns for the home and away team
+home_cols = [f'home_on_{i}' for i in range(1, 8)]
+away_cols = [f'away_on_{i}' for i in range(1, 8)]
+
+cols_keep = [
+    "game_id", "game_period", "game_seconds", 'event_index',
+    "home_on_1", "home_on_2", "home_on_3", "home_on_4", "home_on_5", "home_on_6", "home_on_7",
+    "away_on_1", "away_on_2", "away_on_3", "away_on_4", "away_on_5", "away_on_6", "away_on_7",
+    'home_goalie', 'away_goalie']
+
+
+def _segments(start, end):
+    # Split the period at every shift start and end time. Segment k is the open interval between the
+    # (k-1)th and kth time, a shift covers the segments from its start to its end. Returns the times
+    # and the shift positions of every segment, kept in the original order of the shift data
+    bounds = np.unique(np.concatenate([start, end]))
+    first = np.searchsorted(bounds, start, side='right')
+    count = np.maximum(np.searchsorted(bounds, end, side='left') - first + 1, 0)
+
+    shift = np.repeat(np.arange(len(start)), count)
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    segment = np.repeat(first, count) + offset
+
+    order = np.lexsort((shift, segment))
+    pointer = np.searchsorted(segment[order], np.arange(len(bounds) + 2))
+    return bounds, pointer, shift[order]
+
+
+def build_shift_index(shifts, goalie_id, player_ids=False):
+    # Segments of every game and period, the players are listed in the same order as the per-event
+    # filter would list them. Shifts without a start or end time are never on the ice.
+    # Players are labelled by name, or by player ID when player_ids is set
+    valid = shifts['globalStartTime'].notna() & shifts['globalEndTime'].notna()
+    shifts = shifts[valid.to_numpy()]
+    index = shifts.groupby(['gameId', 'period'], sort=False).indices
+
+    start = shifts['globalStartTime'].to_numpy(dtype=float)
+    end = shifts['globalEndTime'].to_numpy(dtype=float)
+    team = shifts['teamAbbrev'].to_numpy(dtype=object)
+    name = shifts['playerId' if player_ids else 'fullName'].to_numpy(dtype=object)
+    goalie = shifts['playerId'].isin(goalie_id).to_numpy()
+
+    return {
+        (int(game), int(period)): (*_segments(start[pos], end[pos]), team[pos], name[pos], goalie[pos])
+        for (game, period), pos in index.items()
+    }
+
+
+def stop_times(pbp):
+    # Events that use the strict start time, the event stops play or the next event of the game at the
+    # same second does
+    same_game = pbp['game_id'].shift(-1) == pbp['game_id']
+    next_seconds = pbp['game_seconds'].shift(-1)
+    next_type = pbp['event_type'].shift(-1)
+    return (
+        pbp['event_type'].isin(events_stop)
+        | (same_game & (pbp['game_seconds'] == next_seconds) & next_type.isin(events_stop))
+    ).to_numpy()
+
+
+def _fill_team(n_segments, segment, name, goalie):
+    # Place the first seven players of the team on the ice in each segment into the on-ice columns and
+    # pick out the goalie, segment holds the segment of every shift of the team in segment order
+    rank = np.arange(len(segment)) - np.searchsorted(segment, segment, side='left')
+    keep = rank < 7
+    players = np.full((n_segments, 7), np.nan, dtype=object)
+    players[segment[keep], rank[keep]] = name[keep]
+
+    goalies = np.full(n_segments, np.nan, dtype=object)
+    goalie_segment, first = np.unique(segment[goalie], return_index=True)
+    goalies[goalie_segment] = name[goalie][first]
+    return players, goalies
+
+
+def assign_on_ice(pbp_transform, shifts, goalie_id, player_ids=False):
+
+    # ------------------------------------------------------------------------------------------------
+    # Prevent cross-game mixing, the last play of each game has no next play and is not assigned
+    # ------------------------------------------------------------------------------------------------
+    next_game = pbp_transform['game_id'].shift(-1)
+    keep = (next_game == pbp_transform['game_id']).to_numpy()
+    events = pbp_transform.loc[keep, ['game_id', 'game_period', 'game_seconds', 'event_index',
+                                      'event_type', 'home_team', 'away_team']]
+
+    # Use the strict start time when the event stops play or the next event at the same second does
+    stop_time = stop_times(pbp_transform)[keep]
+
+    shift_index = build_shift_index(shifts, goalie_id, player_ids)
+
+    n = len(events)
+    home_on = np.full((n, 7), np.nan, dtype=object)
+    away_on = np.full((n, 7), np.nan, dtype=object)
+    home_goalie = np.full(n, np.nan, dtype=object)
+    away_goalie = np.full(n, np.nan, dtype=object)
+
+    game_seconds = events['game_seconds'].to_numpy(dtype=float)
+    home_team = events['home_team'].to_numpy(dtype=object)
+    away_team = events['away_team'].to_numpy(dtype=object)
+
+    for (game, period), pos in events.groupby(['game_id', 'game_period'], sort=False).indices.items():
+        group = shift_index.get((int(game), int(period)))
+        if group is None:
+            continue
+        bounds, pointer, shift, team, name, goalie = group
+
+        # An event at a shift start or end time falls in the segment after it, or the one before it
+        # when the strict start time is used. Any other time falls in the segment that contains it
+        t = game_seconds[pos]
+        segment = np.where(stop_time[pos], np.searchsorted(bounds, t, side='left'),
+                           np.searchsorted(bounds, t, side='right'))
+
+        shift_segment = np.repeat(np.arange(len(bounds) + 1), np.diff(pointer))
+        for team_on, team_goalie, abbrev in ((home_on, home_goalie, home_team[pos[0]]),
+                                             (away_on, away_goalie, away_team[pos[0]])):
+            mask = team[shift] == abbrev
+            players, goalies = _fill_team(len(bounds) + 1, shift_segment[mask], name[shift[mask]],
+                                          goalie[shift[mask]])
+            team_on[pos], team_goalie[pos] = players[segment], goalies[segment]
+
+    on_ice_df = events[['game_id', 'game_period', 'game_seconds', 'event_index']].copy()
+    on_ice_df = pd.concat([
+        on_ice_df,
+        pd.DataFrame(home_on, index=on_ice_df.index, columns=home_cols),
+        pd.DataFrame(away_on, index=on_ice_df.index, columns=away_cols),
+    ], axis=1)
+    on_ice_df['home_goalie'] = home_goalie
+    on_ice_df['away_goalie'] = away_goalie
+
+    # Player IDs are stored as nullable integers instead of Python objects
+    if player_ids:
+        player_cols = home_cols + away_cols + ['home_goalie', 'away_goalie']
+        on_ice_df[player_cols] = on_ice_df[player_cols].astype('Int64')
+
+    return on_ice_df[cols_keep]
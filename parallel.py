@@ -0,0 +1,61 @@
+# ---------------------------------------------------------------------------------------------------
+# Parallel transformation across games. Games are split into shards that are transformed on a pool
+# of processes, the player and schedule maps are sent to each process once when it starts.
+# ---------------------------------------------------------------------------------------------------
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from shift_store import ShiftStore
+from transform import transform_games, compact_dtypes
+
+# Number of shards created for each process, more shards keep every process busy until the end
+shards_per_worker = 4
+
+# Maps held by each worker process, set once by the pool initializer
+_maps = {}
+
+
+def _init_worker(schedule_map, player_map, goalie_id, player_ids, describe_events):
+    _maps['schedule_map'] = schedule_map
+    _maps['player_map'] = player_map
+    _maps['goalie_id'] = goalie_id
+    _maps['player_ids'] = player_ids
+    _maps['describe_events'] = describe_events
+
+
+def _transform_shard(pbp, shifts):
+    return transform_games(pbp, shifts, _maps['schedule_map'], _maps['player_map'], _maps['goalie_id'],
+                           _maps['player_ids'], _maps['describe_events'])
+
+
+def split_games(pbp, shifts, n_shards):
+    # Split the games into shards keeping every row of a game, and its order, in the same shard. A shift
+    # store is shared by every shard, each process reads the games it needs from it
+    game_ids = pbp['game_id'].unique()
+    for shard_ids in np.array_split(game_ids, n_shards):
+        if len(shard_ids) == 0:
+            continue
+        yield (pbp[pbp['game_id'].isin(shard_ids)],
+               shifts if isinstance(shifts, ShiftStore) else shifts[shifts['gameId'].isin(shard_ids)])
+
+
+def transform_parallel(pbp, shifts, schedule_map, player_map, goalie_id, workers=None, player_ids=False,
+                       describe_events=None):
+    # Same result as transform_games, the shifts must already have been through transform_shifts
+    workers = workers or os.cpu_count()
+    shards = list(split_games(pbp, shifts, workers * shards_per_worker))
+
+    # Without any game there is nothing to send to the pool, the empty frame is built here
+    if not shards:
+        return transform_games(pbp, shifts, schedule_map, player_map, goalie_id, player_ids, describe_events)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(schedule_map, player_map, goalie_id, player_ids, describe_events)) as pool:
+        results = list(pool.map(_transform_shard, *zip(*shards)))
+
+    # Categories differ between shards so the concatenated columns are made categorical again
+    final_pbp = compact_dtypes(pd.concat(results, ignore_index=True))
+    return final_pbp.sort_values(['game_id', 'game_seconds', 'event_index'], kind='stable').reset_index(drop=True)
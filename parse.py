@@ -0,0 +1,74 @@
+# ---------------------------------------------------------------------------------------------------
+# Direct JSON to column parser for the play-by-play and shift payloads. Only the fields used by the
+# pipeline are read, each straight into a NumPy column, instead of flattening every nested key of every
+# play with pd.json_normalize. Columns get the same names and types json_normalize would give them.
+# ---------------------------------------------------------------------------------------------------
+import json
+
+import numpy as np
+import pandas as pd
+
+# Decode raw response bytes with orjson when it is installed
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+# Fields read from each play, the column name is the path of the field joined by dots
+play_fields = [
+    'typeDescKey', 'timeInPeriod', 'timeRemaining', 'periodDescriptor.number', 'homeTeamDefendingSide',
+    'details.eventOwnerTeamId', 'details.shotType', 'details.descKey', 'details.duration',
+    'details.zoneCode', 'details.xCoord', 'details.yCoord', 'details.scoringPlayerId',
+    'details.assist1PlayerId', 'details.assist2PlayerId', 'details.winningPlayerId',
+    'details.losingPlayerId', 'details.shootingPlayerId', 'details.blockingPlayerId',
+    'details.hittingPlayerId', 'details.hitteePlayerId', 'details.committedByPlayerId',
+    'details.drawnByPlayerId', 'details.playerId'
+]
+
+# Fields read from each shift
+shift_fields = [
+    'id', 'gameId', 'playerId', 'teamId', 'teamAbbrev', 'period', 'shiftNumber', 'typeCode', 'detailCode',
+    'startTime', 'endTime', 'duration'
+]
+
+# Fields holding text, every other field is a number
+text_fields = [
+    'typeDescKey', 'timeInPeriod', 'timeRemaining', 'homeTeamDefendingSide', 'details.shotType',
+    'details.descKey', 'details.zoneCode', 'teamAbbrev', 'startTime', 'endTime', 'duration'
+]
+
+_missing = {}
+
+
+def _values(records, field):
+    # Value of a field for every record, missing fields are NaN like json_normalize
+    path = field.split('.')
+    if len(path) == 1:
+        return [record.get(field, np.nan) for record in records]
+
+    parent, key = path
+    return [record.get(parent, _missing).get(key, np.nan) for record in records]
+
+
+def _column(values, field):
+    if field in text_fields:
+        return np.array(values, dtype=object)
+
+    # Integers stay integers unless a value is missing, then the column is float like json_normalize
+    column = np.array(values)
+    if column.dtype == object:
+        column = np.array(values, dtype=np.float64)
+    return column
+
+
+def columns(records, fields):
+    return pd.DataFrame({field: _column(_values(records, field), field) for field in fields})
+
+
+def parse_plays(data_game):
+    return columns(data_game.get('plays', []), play_fields)
+
+
+def parse_shifts(data_shift):
+    return columns(data_shift.get('data', []), shift_fields)
@@ -0,0 +1,201 @@
+# ---------------------------------------------------------------------------------------------------
+# Local query store over the final play-by-play. Events are kept in a SQLite file with indexes on game,
+# event type, season and team, and every player of an event, on the ice or as one of the event players,
+# is listed in an inverted index from player ID to event. Finding every event for a player is then one
+# index lookup instead of a scan of 14 on-ice columns of the full play-by-play. When the player columns
+# hold names they are matched to player IDs through the rosters.
+#
+#   conn = query.connect()
+#   query.events(conn, player=8478402, role='on_ice', event_type=['SHOT', 'GOAL'], strength='5v5')
+#   query.events(conn, team='TOR', event_team='TOR', event_type='GOAL')
+# ---------------------------------------------------------------------------------------------------
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from on_ice import home_cols, away_cols
+
+# File of the query store, next to the rest of the saved data
+db_path = os.path.join(os.environ.get('NHL_OUTPUT_DIR', 'nhl_data'), 'final_pbp.sqlite')
+
+# Columns listed in the inverted index for each event, the role of a player is the column they are in
+event_roles = ['event_player_1', 'event_player_2', 'event_player_3']
+on_ice_roles = home_cols + away_cols
+
+# Indexed columns of the events table
+indexes = {
+    'game': ['game_id'],
+    'event_type': ['event_type', 'game_strength_state'],
+    'season': ['season', 'season_type'],
+    'event_team': ['event_team'],
+    'home_team': ['home_team'],
+    'away_team': ['away_team'],
+}
+
+
+def connect(path=None):
+    path = path or db_path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _rows(df):
+    # Python values for every row, missing values become NULL
+    values = df.astype(object).where(df.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+def _create(conn, final_pbp):
+    columns = ', '.join(f'"{col}" {_sql_type(dtype)}' for col, dtype in final_pbp.dtypes.items())
+    conn.execute(f'CREATE TABLE IF NOT EXISTS events (event_id INTEGER PRIMARY KEY, {columns})')
+    conn.execute('CREATE TABLE IF NOT EXISTS event_players ('
+                 'player, event_id INTEGER, role TEXT, PRIMARY KEY (player, event_id, role)) WITHOUT ROWID')
+    conn.execute('CREATE INDEX IF NOT EXISTS event_players_event ON event_players (event_id)')
+    for name, cols in indexes.items():
+        quoted = ', '.join(f'"{col}"' for col in cols)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS events_{name} ON events ({quoted})')
+
+
+def _lookup(Players, keys):
+    # Player ID of each player name from the rosters, keyed by the given roster columns. Keys that belong
+    # to more than one player are left out
+    roster = Players[['PlayerID', 'PlayerName', 'Season', 'Team']].dropna().drop_duplicates(['PlayerID'] + keys)
+    roster['Season'] = roster['Season'].astype(int)
+    return roster[~roster.duplicated(keys, keep=False)].set_index(keys)['PlayerID']
+
+
+def player_ids(events, roles, Players):
+    # Player ID of every player in the role columns, one row for each player and column they appear in.
+    # Names are matched to the roster of the team of the column in that season, the event players to the
+    # event team and then its opponent, and at last to the only player with that name
+    players = events[roles].melt(ignore_index=False, var_name='role', value_name='player').dropna(subset=['player'])
+    if pd.api.types.is_numeric_dtype(events[roles[0]]):
+        return players.assign(player=players['player'].astype('int64'))
+    if Players is None:
+        raise ValueError('The player columns hold names, the rosters are needed to match them to player IDs')
+
+    game = events.loc[players.index]
+    season = game['season'].astype(int).to_numpy()
+    home = players['role'].isin(home_cols).to_numpy()
+    on_ice = players['role'].isin(on_ice_roles).to_numpy()
+    team = np.where(on_ice, np.where(home, game['home_team'], game['away_team']), game['event_team'])
+    opponent = np.where(game['event_team'] == game['home_team'], game['away_team'], game['home_team'])
+    name = players['player'].astype(object).to_numpy()
+
+    by_team = _lookup(Players, ['Season', 'Team', 'PlayerName'])
+    ids = by_team.reindex(pd.MultiIndex.from_arrays([season, team.astype(object), name])).to_numpy()
+    opponent_ids = by_team.reindex(pd.MultiIndex.from_arrays([season, opponent.astype(object), name])).to_numpy()
+    ids = np.where(pd.isna(ids) & ~on_ice, opponent_ids, ids)
+    ids = np.where(pd.isna(ids), _lookup(Players, ['PlayerName']).reindex(name).to_numpy(), ids)
+
+    players = players.assign(player=ids).dropna(subset=['player'])
+    return players.assign(player=players['player'].astype('int64'))
+
+
+def write(final_pbp, path=None, Players=None):
+    # Add the events to the store, games that were already stored are replaced. Players are the rosters
+    # the names in the player columns are matched to player IDs with
+    conn = connect(path)
+    with conn:
+        _create(conn, final_pbp)
+
+        game_ids = [int(game) for game in final_pbp['game_id'].unique()]
+        marks = ', '.join('?' * len(game_ids))
+        conn.execute(f'DELETE FROM event_players WHERE event_id IN '
+                     f'(SELECT event_id FROM events WHERE game_id IN ({marks}))', game_ids)
+        conn.execute(f'DELETE FROM events WHERE game_id IN ({marks})', game_ids)
+
+        # New event IDs follow the largest event ID in the store
+        first_id = conn.execute('SELECT COALESCE(MAX(event_id), 0) + 1 FROM events').fetchone()[0]
+        events = final_pbp.reset_index(drop=True)
+        event_id = pd.Series(np.arange(first_id, first_id + len(events)), name='event_id')
+
+        columns = ', '.join(['event_id'] + [f'"{col}"' for col in events.columns])
+        marks = ', '.join('?' * (len(events.columns) + 1))
+        conn.executemany(f'INSERT INTO events ({columns}) VALUES ({marks})',
+                         _rows(pd.concat([event_id, events], axis=1)))
+
+        # One row for each player and column they appear in
+        roles = [col for col in event_roles + on_ice_roles if col in events]
+        players = player_ids(events.set_axis(event_id, axis=0), roles, Players).reset_index()
+        conn.executemany('INSERT OR IGNORE INTO event_players (player, event_id, role) VALUES (?, ?, ?)',
+                         _rows(players[['player', 'event_id', 'role']]))
+    conn.close()
+
+
+def write_from_store(root=None, path=None):
+    # Build the query store from the saved play-by-play one season at a time
+    import store
+
+    seasons = store.read('final_pbp', columns=['season'], root=root)['season'].unique()
+    Players = store.read('Players', root=root)
+    for season in sorted(seasons):
+        write(store.read('final_pbp', filters=[('season', '=', season)], root=root), path, Players)
+
+
+def _value(value):
+    # NumPy scalars are turned into Python values, SQLite would store them as blobs
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _in(column, values, where, params):
+    values = list(values) if isinstance(values, (list, tuple, set, np.ndarray, pd.Series)) else [values]
+    where.append(f'"{column}" IN ({", ".join("?" * len(values))})')
+    params.extend(_value(value) for value in values)
+
+
+def events(conn, player=None, role=None, game_id=None, event_type=None, season=None, team=None, event_team=None,
+           strength=None, columns=None):
+    # Events matching every filter given. player is a player ID, role limits the player to 'on_ice',
+    # 'event' (any event player) or a single column such as 'event_player_1'. team keeps the events of
+    # games the team played as the home or away team, event_team only the events of that team. Filters
+    # take one value or a list of values
+    where = []
+    params = []
+
+    if player is not None:
+        players = 'SELECT event_id FROM event_players WHERE player = ?'
+        params.append(_value(player))
+        if role == 'on_ice':
+            players += " AND role GLOB '*_on_*'"
+        elif role == 'event':
+            players += " AND role GLOB 'event_player_*'"
+        elif role is not None:
+            players += ' AND role = ?'
+            params.append(role)
+        where.append(f'event_id IN ({players})')
+
+    if team is not None:
+        home, away = [], []
+        _in('home_team', team, home, params)
+        _in('away_team', team, away, params)
+        where.append(f'({home[0]} OR {away[0]})')
+
+    for column, value in [('game_id', game_id), ('event_type', event_type), ('season', season),
+                          ('event_team', event_team), ('game_strength_state', strength)]:
+        if value is not None:
+            _in(column, value, where, params)
+
+    select = ', '.join(f'"{col}"' for col in columns) if columns else '*'
+    sql = f'SELECT {select} FROM events'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    return pd.read_sql_query(sql + ' ORDER BY event_id', conn, params=params)
+
+
+def player_events(conn, player):
+    # Every event of a player ID with the columns the player appears in
+    return pd.read_sql_query('SELECT event_id, role FROM event_players WHERE player = ? ORDER BY event_id',
+                             conn, params=[_value(player)])
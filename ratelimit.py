@@ -0,0 +1,150 @@
+# ---------------------------------------------------------------------------------------------------
+# Request scheduler for the NHL API. Every host has its own token bucket for the request rate and its
+# own limit on the requests in flight. Both are halved when the API throttles (429, 503) or a
+# connection fails and grow back slowly while responses are healthy, so the rate settles at what the
+# API will tolerate. Failed requests are retried with jittered exponential backoff.
+# ---------------------------------------------------------------------------------------------------
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests as req
+
+# Requests per second allowed to each host when a run starts and the most it can grow to
+start_rate = float(os.environ.get('NHL_RATE', 20))
+max_rate = float(os.environ.get('NHL_MAX_RATE', 100))
+
+# Requests in flight to each host when a run starts and the most it can grow to
+start_concurrency = int(os.environ.get('NHL_CONCURRENCY', 8))
+max_concurrency = int(os.environ.get('NHL_MAX_WORKERS', 16))
+
+# Attempts for each request and the base and largest wait in seconds between attempts
+max_attempts = int(os.environ.get('NHL_MAX_ATTEMPTS', 6))
+backoff_base = 0.5
+backoff_cap = 30
+
+# Seconds to wait for the API to answer a request
+timeout = 30
+
+# Status codes that are retried, 429 and 503 mean the API is throttling requests
+retry_status = [429, 500, 502, 503, 504]
+throttle_status = [429, 503]
+
+
+class RequestFailed(Exception):
+
+    def __init__(self, url, status_code=None, reason=None, attempts=None):
+        attempts = max_attempts if attempts is None else attempts
+        super().__init__(f'{url} failed after {attempts} attempts: {status_code or reason}')
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+
+
+class Host:
+    # Token bucket and limit of the requests in flight for one host, adjusted from the responses
+
+    def __init__(self):
+        self.rate = start_rate
+        self.tokens = start_rate
+        self.updated = time.monotonic()
+        self.limit = start_concurrency
+        self.in_flight = 0
+        self.healthy = 0
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Wait for a free slot and a token, both are taken under the same lock
+        with self.condition:
+            while True:
+                self._refill()
+                if self.in_flight < self.limit and self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                wait = 0.05 if self.in_flight >= self.limit else (1 - self.tokens) / self.rate
+                self.condition.wait(wait)
+
+    def release(self, throttled=False, healthy=True):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                # Multiplicative decrease as soon as the API pushes back
+                self.rate = max(1.0, self.rate / 2)
+                self.tokens = min(self.tokens, self.rate)
+                self.limit = max(1, self.limit // 2)
+                self.healthy = 0
+            elif healthy:
+                # Additive increase after a full window of healthy responses
+                self.healthy += 1
+                if self.healthy >= self.limit:
+                    self.healthy = 0
+                    self.limit = min(max_concurrency, self.limit + 1)
+                    self.rate = min(max_rate, self.rate + 1)
+            self.condition.notify_all()
+
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def host_for(url):
+    name = urlsplit(url).netloc
+    with _hosts_lock:
+        if name not in _hosts:
+            _hosts[name] = Host()
+        return _hosts[name]
+
+
+def backoff(attempt, retry_after=None):
+    # Full jitter, the wait is random between 0 and the exponential limit. Retry-After from the API
+    # is used as the least amount of time to wait
+    wait = random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+    if retry_after is not None:
+        try:
+            wait = max(wait, float(retry_after))
+        except ValueError:
+            pass
+    return wait
+
+
+def request(session, url):
+    # Request the url through the host's bucket, retrying failures until max_attempts is reached
+    host = host_for(url)
+    status_code = None
+    reason = None
+
+    for attempt in range(max_attempts):
+        host.acquire()
+
+        # The slot is always given back. A request error such as a dropped connection, a timeout or a
+        # body cut off part way counts as a failed attempt and as the API pushing back, any other error
+        # is raised after releasing the slot
+        throttled, healthy = True, True
+        try:
+            response = session.get(url, timeout=timeout)
+            status_code = response.status_code
+            throttled, healthy = status_code in throttle_status, status_code < 500
+        except req.RequestException as error:
+            response = None
+            status_code, reason = None, type(error).__name__
+        finally:
+            host.release(throttled=throttled, healthy=healthy)
+
+        retry_after = None
+        if response is not None:
+            if status_code not in retry_status:
+                return response
+            retry_after = getattr(response, 'headers', {}).get('Retry-After')
+
+        if attempt + 1 < max_attempts:
+            time.sleep(backoff(attempt, retry_after))
+
+    raise RequestFailed(url, status_code, reason)
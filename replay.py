@@ -0,0 +1,161 @@
+# ---------------------------------------------------------------------------------------------------
+# Recorded games for testing live.py. A recording holds the play-by-play and shift chart of a game at
+# each poll while it was played, plus the rosters of both teams. The server answers the NHL API urls
+# from a recording, every play-by-play request of a game moves it one poll further, so live.py can be
+# run against a local server as if the game were being played.
+#
+#   python replay.py record recordings/game 2024020123       record a game in progress
+#   python replay.py synthetic recordings/game                record a generated game
+#   python replay.py serve recordings/game --port 8000
+#   NHL_WEB_API=http://localhost:8000/v1 NHL_STATS_API=http://localhost:8000/stats/rest/en \
+#       python live.py 2024020123 --interval 0
+# ---------------------------------------------------------------------------------------------------
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+game_pattern = re.compile(r'/gamecenter/(\d+)/play-by-play')
+shift_pattern = re.compile(r'/shiftcharts\?cayenneExp=gameId=(\d+)')
+roster_pattern = re.compile(r'/roster/(\w+)/(\d+)')
+
+
+def _path(folder, *parts):
+    return os.path.join(folder, *[str(part) for part in parts])
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f)
+
+
+def save_poll(folder, Game, poll, data_game, data_shift):
+    _write(_path(folder, Game, f'{poll:04d}-pbp.json'), data_game)
+    _write(_path(folder, Game, f'{poll:04d}-shifts.json'), data_shift)
+
+
+def save_roster(folder, triCode, season, data_roster):
+    _write(_path(folder, 'roster', f'{triCode}-{season}.json'), data_roster)
+
+
+def polls(folder, Game):
+    # Number of polls recorded for the game
+    files = os.listdir(_path(folder, Game)) if os.path.isdir(_path(folder, Game)) else []
+    return len([file for file in files if file.endswith('-pbp.json')])
+
+
+def record(folder, game_ids, interval=10, session=None):
+    # Poll the games until they are final and save every poll, with the rosters of both teams
+    from cache import final_states
+    from fetch import make_session, game_url, shift_url, roster_url
+    from live import get_json
+
+    session = session or make_session()
+    active = list(game_ids)
+    poll = 0
+    while active:
+        for Game in list(active):
+            data_game = get_json(session, game_url(Game))
+            data_shift = get_json(session, shift_url(Game))
+            if data_game is None or data_shift is None:
+                continue
+            if poll == 0:
+                season = data_game['season']
+                for team in (data_game['homeTeam'], data_game['awayTeam']):
+                    save_roster(folder, team['abbrev'], season, get_json(session, roster_url(team['abbrev'], season)))
+            save_poll(folder, Game, poll, data_game, data_shift)
+            if data_game.get('gameState') in final_states:
+                active.remove(Game)
+        poll += 1
+        if active:
+            time.sleep(interval)
+
+
+def record_synthetic(folder, Game=2024020001, steps=20, shift_delay=60, seed=0):
+    # Recording of a generated game, shifts are listed some time after they end
+    import synthetic
+
+    home, away = synthetic.teams[0], synthetic.teams[1]
+    snapshots = synthetic.live_snapshots(synthetic.game(Game, home, away, seed=seed),
+                                         synthetic.shifts(Game, home, away, seed=seed), steps, shift_delay)
+    for poll, (data_game, data_shift) in enumerate(snapshots):
+        save_poll(folder, Game, poll, data_game, data_shift)
+    for team_id, triCode in (home, away):
+        save_roster(folder, triCode, snapshots[0][0]['season'], synthetic.roster(team_id, triCode, seed))
+    return Game
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Answers from server.folder, server.polls holds the poll each game is at
+
+    def _send(self, path):
+        if path is None or not os.path.exists(path):
+            self.send_response(404)
+            self.end_headers()
+            return
+        with open(path, 'rb') as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        folder = self.server.folder
+        game = game_pattern.search(self.path)
+        shift = shift_pattern.search(self.path)
+        roster = roster_pattern.search(self.path)
+
+        path = None
+        if game:
+            Game = game.group(1)
+            with self.server.lock:
+                poll = self.server.polls[Game] = min(self.server.polls.get(Game, -1) + 1, polls(folder, Game) - 1)
+            path = _path(folder, Game, f'{poll:04d}-pbp.json')
+        elif shift:
+            Game = shift.group(1)
+            path = _path(folder, Game, f'{max(self.server.polls.get(Game, 0), 0):04d}-shifts.json')
+        elif roster:
+            path = _path(folder, 'roster', f'{roster.group(1)}-{roster.group(2)}.json')
+        self._send(path)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(folder, port=8000):
+    # Server for the recording, serve_forever() runs it, server.server_address holds the port in use
+    server = ThreadingHTTPServer(('localhost', port), Handler)
+    server.folder = folder
+    server.polls = {}
+    server.lock = threading.Lock()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record games in progress and replay them for live.py.')
+    parser.add_argument('command', choices=['record', 'synthetic', 'serve'])
+    parser.add_argument('folder', help='folder of the recording')
+    parser.add_argument('games', type=int, nargs='*', help='game IDs to record')
+    parser.add_argument('--interval', type=float, default=10, help='seconds between polls when recording')
+    parser.add_argument('--port', type=int, default=8000, help='port the recording is served on')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(args.folder, args.games, args.interval)
+    elif args.command == 'synthetic':
+        print(record_synthetic(args.folder, *args.games[:1]))
+    else:
+        server = serve(args.folder, args.port)
+        print(f'Serving {args.folder} on http://localhost:{server.server_address[1]}')
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
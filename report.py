@@ -0,0 +1,159 @@
+# ---------------------------------------------------------------------------------------------------
+# Run report. Each stage of the pipeline records its wall time, the requests it made and the bytes it
+# downloaded, the rows it produced and the peak resident memory of the process while it ran. Stages
+# can be nested and a stage that runs many times (once per game when streaming) is added up under one
+# name. The report is written as JSON so runs can be compared with each other.
+# ---------------------------------------------------------------------------------------------------
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Stages are only recorded once the report is enabled, profile also runs cProfile on every stage and
+# keeps the profile of the slowest one
+enabled = False
+profile = False
+
+# Seconds between samples of the resident memory
+sample_interval = 0.05
+
+_lock = threading.Lock()
+_requests = {'requests': 0, 'cached': 0, 'failed': 0, 'bytes': 0}
+_notes = {}
+_open = []
+_stages = {}
+_profiles = {}
+_started = None
+
+
+def enable(with_profile=False):
+    global enabled, profile, _started
+    enabled = True
+    profile = with_profile
+    _started = time.time()
+    threading.Thread(target=_sample, daemon=True).start()
+
+
+def record_request(response, cached=False, failed=False):
+    # Called by the fetch layer for every response, bytes only count responses from the network
+    with _lock:
+        if failed:
+            _requests['failed'] += 1
+        elif cached:
+            _requests['cached'] += 1
+        else:
+            _requests['requests'] += 1
+            _requests['bytes'] += len(response.content or b'')
+
+
+def rss():
+    # Resident memory of the process in bytes, the peak so far where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _sample():
+    while True:
+        current = rss()
+        with _lock:
+            for record in _open:
+                record['peak_rss'] = max(record['peak_rss'], current)
+        time.sleep(sample_interval)
+
+
+def start(name):
+    # Open a stage inside the stage that is currently open
+    if not enabled:
+        return
+    with _lock:
+        path = '/'.join([record['name'] for record in _open] + [name])
+        record = dict(_requests, name=path, start=time.perf_counter(), peak_rss=rss(), profiler=None)
+        _open.append(record)
+
+    if profile and not any(record['profiler'] for record in _open):
+        record['profiler'] = cProfile.Profile()
+        record['profiler'].enable()
+
+
+def finish(rows=None):
+    # Close the most recent stage, rows is the number of rows the stage produced
+    if not enabled or not _open:
+        return
+    seconds = time.perf_counter() - _open[-1]['start']
+    current = rss()
+
+    with _lock:
+        record = _open.pop()
+        total = _stages.setdefault(record['name'], dict(
+            {'calls': 0, 'seconds': 0.0}, **dict.fromkeys(_requests, 0), rows=0, peak_rss_mb=0.0))
+        total['calls'] += 1
+        total['seconds'] += seconds
+        for key in _requests:
+            total[key] += _requests[key] - record[key]
+        total['rows'] += rows or 0
+        total['peak_rss_mb'] = max(total['peak_rss_mb'], round(max(record['peak_rss'], current) / 2**20, 1))
+
+    if record['profiler'] is not None:
+        record['profiler'].disable()
+        profiler, slowest = _profiles.get(record['name'], (None, 0))
+        if profiler is None or seconds > slowest:
+            _profiles[record['name']] = (record['profiler'], seconds)
+
+
+def note(key, value):
+    # Extra information about the run added to the report, such as the games that failed
+    _notes[key] = value
+
+
+@contextmanager
+def stage(name):
+    # Same as start and finish around a block, set counts['rows'] to record the rows produced
+    counts = {}
+    start(name)
+    try:
+        yield counts
+    finally:
+        finish(counts.get('rows'))
+
+
+def summary():
+    stages = []
+    for name, total in _stages.items():
+        seconds = total['seconds']
+        stages.append(dict(
+            total, stage=name, seconds=round(seconds, 4),
+            rows_per_second=round(total['rows'] / seconds) if total['rows'] and seconds > 0 else None))
+
+    return {
+        'started': _started,
+        'seconds': round(time.time() - _started, 4) if _started else None,
+        'requests': _requests['requests'],
+        'cached': _requests['cached'],
+        'failed': _requests['failed'],
+        'bytes': _requests['bytes'],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 1),
+        'stages': stages,
+        **_notes,
+    }
+
+
+def write(path):
+    # Write the report, with profiling the cProfile stats of the slowest stage are written next to it
+    # and can be read with pstats
+    report = summary()
+
+    if _profiles:
+        name = max(_profiles, key=lambda name: _stages[name]['seconds'])
+        profile_path = os.path.splitext(path)[0] + '.prof'
+        _profiles[name][0].dump_stats(profile_path)
+        report['profile'] = {'stage': name, 'path': profile_path}
+
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
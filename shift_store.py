@@ -0,0 +1,185 @@
+# ---------------------------------------------------------------------------------------------------
+# Memory-mapped shift store. The transformed shifts are kept as fixed-width NumPy records, each batch of
+# games written is one file sorted by game, next to an index for each season of the file each game is in
+# and where its shifts start and stop. The on-ice stage memory-maps the files and reads only the slices
+# of the games it is working on, so the shifts of every season never have to be loaded into one DataFrame.
+#
+#   python pbp.py --shift-store                       shifts are written a few games at a time as they arrive
+#
+#   shift_store.write(shifts, schedule_map)
+#   shifts = shift_store.load()
+#   final_pbp = transform_games(pbp, shifts, schedule_map, player_map, goalie_id)
+# ---------------------------------------------------------------------------------------------------
+import os
+
+import numpy as np
+import pandas as pd
+
+import on_ice
+from fileio import atomic_write
+
+# Folder of the store, next to the rest of the saved data
+store_dir = os.path.join(os.environ.get('NHL_OUTPUT_DIR', 'nhl_data'), 'shift_store')
+
+# Games whose shifts are held in memory at once, when they are fetched and by the on-ice stage
+batch_games = 200
+
+# One record for each shift, home is 1 for a shift of the home team and 0 for the away team
+shift_dtype = np.dtype([
+    ('gameId', np.int32), ('playerId', np.int32), ('period', np.int16), ('start', np.int32), ('end', np.int32),
+    ('home', np.int8),
+])
+index_dtype = np.dtype([('gameId', np.int32), ('part', np.int32), ('start', np.int64), ('stop', np.int64)])
+
+
+def _season(game_id):
+    start_year = int(game_id) // 1000000
+    return start_year * 10000 + start_year + 1
+
+
+def _index_path(root, season):
+    return os.path.join(root, f'{season}.index.npy')
+
+
+def _part_path(root, season, part):
+    return os.path.join(root, f'{season}.{part}.npy')
+
+
+def _save(path, array):
+    atomic_write(path, array, 'wb', lambda array, f: np.save(f, array))
+
+
+def to_records(shifts, schedule_map):
+    # Records of transformed shifts, shifts without a start or end time are never on the ice and are left
+    # out. Each game keeps the order of the shift data, the on-ice players are listed in that order
+    shifts = shifts.dropna(subset=['globalStartTime', 'globalEndTime'])
+    home_team = shifts['gameId'].map(schedule_map['homeTeam.abbrev'])
+
+    records = np.empty(len(shifts), dtype=shift_dtype)
+    records['gameId'] = shifts['gameId'].to_numpy()
+    records['playerId'] = shifts['playerId'].to_numpy()
+    records['period'] = shifts['period'].to_numpy()
+    records['start'] = shifts['globalStartTime'].to_numpy()
+    records['end'] = shifts['globalEndTime'].to_numpy()
+    records['home'] = (shifts['teamAbbrev'] == home_team).to_numpy()
+    return records[np.argsort(records['gameId'], kind='stable')]
+
+
+def build_index(records, part=0):
+    game_ids, start, counts = np.unique(records['gameId'], return_index=True, return_counts=True)
+    index = np.empty(len(game_ids), dtype=index_dtype)
+    index['gameId'] = game_ids
+    index['part'] = part
+    index['start'] = start
+    index['stop'] = start + counts
+    return index
+
+
+def write(shifts, schedule_map, root=None):
+    # Add the shifts to the store as a new file for each season, only the season index is written again.
+    # Games that were already stored are pointed at the new file, files left without a game are removed
+    root = root or store_dir
+    os.makedirs(root, exist_ok=True)
+    records = to_records(shifts, schedule_map)
+    seasons = np.array([_season(game_id) for game_id in records['gameId']])
+
+    for season in np.unique(seasons):
+        new = records[seasons == season]
+        index_path = _index_path(root, season)
+        index = np.load(index_path) if os.path.exists(index_path) else np.empty(0, dtype=index_dtype)
+        part = int(index['part'].max()) + 1 if len(index) else 0
+
+        _save(_part_path(root, season, part), new)
+        index = np.concatenate([index[~np.isin(index['gameId'], new['gameId'])], build_index(new, part)])
+        _save(index_path, np.sort(index, order='gameId'))
+
+        for stale in set(range(part)) - set(index['part'].tolist()):
+            if os.path.exists(_part_path(root, season, stale)):
+                os.remove(_part_path(root, season, stale))
+
+
+def write_from_store(root=None, path=None, schedule_map=None):
+    # Build the shift store from the saved shifts one season at a time. The home team of each game is
+    # taken from the saved play-by-play when no schedule map is given
+    import store
+
+    seasons = store.read('shifts', columns=['season'], root=root)['season'].unique()
+    for season in sorted(seasons):
+        shifts = store.read('shifts', filters=[('season', '=', season)], root=root)
+        season_map = schedule_map
+        if season_map is None:
+            games = store.read('final_pbp', columns=['game_id', 'home_team'], filters=[('season', '=', season)],
+                               root=root)
+            season_map = games.drop_duplicates('game_id').set_index('game_id').rename(
+                columns={'home_team': 'homeTeam.abbrev'})
+        write(shifts, season_map, path)
+
+
+class ShiftStore:
+    # Memory-mapped view of the store, each season's file is opened the first time it is read
+
+    def __init__(self, root=None):
+        self.root = root or store_dir
+        self._shifts = {}
+        self.index = {}
+        for file in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            if file.endswith('.index.npy'):
+                season = int(file[:-len('.index.npy')])
+                self.index[season] = pd.DataFrame(np.load(os.path.join(self.root, file))).set_index('gameId')
+
+    def __getstate__(self):
+        # Worker processes open their own memory maps
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    def _part_shifts(self, season, part):
+        if (season, part) not in self._shifts:
+            self._shifts[season, part] = np.load(_part_path(self.root, season, part), mmap_mode='r')
+        return self._shifts[season, part]
+
+    def game_ids(self):
+        return [game_id for index in self.index.values() for game_id in index.index]
+
+    def game(self, game_id):
+        # Records of one game, a slice of the memory-mapped file
+        season = _season(game_id)
+        if season not in self.index or game_id not in self.index[season].index:
+            return np.empty(0, dtype=shift_dtype)
+        part, start, stop = self.index[season].loc[game_id, ['part', 'start', 'stop']]
+        return self._part_shifts(season, part)[start:stop]
+
+    def games(self, game_ids):
+        return np.concatenate([np.empty(0, dtype=shift_dtype)] + [self.game(game_id) for game_id in game_ids])
+
+    def frame(self, game_ids, schedule_map, player_map):
+        # Shifts of the games with the columns the on-ice stage reads
+        records = self.games(game_ids)
+        game_id = pd.Series(records['gameId'].astype(np.int64))
+        home = records['home'].astype(bool)
+        return pd.DataFrame({
+            'gameId': game_id,
+            'playerId': records['playerId'].astype(np.int64),
+            'period': records['period'],
+            'globalStartTime': records['start'].astype(float),
+            'globalEndTime': records['end'].astype(float),
+            'teamAbbrev': np.where(home, game_id.map(schedule_map['homeTeam.abbrev']),
+                                   game_id.map(schedule_map['awayTeam.abbrev'])),
+            'fullName': pd.Series(records['playerId'].astype(np.int64)).map(player_map['PlayerName']),
+        })
+
+    def assign_on_ice(self, pbp_transform, schedule_map, player_map, goalie_id, player_ids=False):
+        # Same result as on_ice.assign_on_ice with every shift in memory, reading batch_games games at a time
+        game_ids = pbp_transform['game_id'].unique()
+        results = []
+        batches = [game_ids[start:start + batch_games] for start in range(0, len(game_ids), batch_games)]
+        for batch_ids in batches or [game_ids]:
+            events = pbp_transform[pbp_transform['game_id'].isin(batch_ids)]
+            shifts = self.frame(batch_ids, schedule_map, player_map)
+            results.append(on_ice.assign_on_ice(events, shifts, goalie_id, player_ids))
+        return pd.concat(results)
+
+
+def load(root=None):
+    return ShiftStore(root)
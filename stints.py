@@ -0,0 +1,140 @@
+# ---------------------------------------------------------------------------------------------------
+# Stints, the longest spans of a game in which neither team changes the players on the ice. The start
+# and end of every shift are change points, the spans between change points are matched to the shifts
+# covering them with sorted searches over every game at once, and neighbouring spans with the same
+# players are joined into one stint. Events of the play-by-play are mapped to the stint they happened in.
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+from on_ice import stop_times
+
+# Skaters listed for each team, the skater count of a stint includes every skater on the ice
+max_skaters = 6
+
+home_skater_cols = [f'home_skater_{i}' for i in range(1, max_skaters + 1)]
+away_skater_cols = [f'away_skater_{i}' for i in range(1, max_skaters + 1)]
+player_cols = home_skater_cols + ['home_goalie'] + away_skater_cols + ['away_goalie']
+
+# Events at the end of a period belong to the stint ending at the event, like events that stop play
+events_end = ['PEND', 'GEND']
+
+# Game seconds are added to the game ID scaled by this factor so every game can be searched at once
+_scale = 100000
+
+# Odd 64 bit constant used to hash player IDs, the sum of the hashes identifies the players of a segment
+_hash = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _keys(game_id, seconds):
+    return np.asarray(game_id, dtype=np.int64) * _scale + np.asarray(seconds, dtype=np.int64)
+
+
+def _segments(shifts):
+    # Spans between consecutive change points of each game
+    points = pd.DataFrame({
+        'game_id': np.concatenate([shifts['gameId'].to_numpy()] * 2),
+        'start': np.concatenate([shifts['globalStartTime'].to_numpy(), shifts['globalEndTime'].to_numpy()]),
+    }).drop_duplicates().sort_values(['game_id', 'start'], ignore_index=True)
+
+    points['end'] = points.groupby('game_id')['start'].shift(-1)
+    return points.dropna(subset=['end']).reset_index(drop=True)
+
+
+def _players(shifts, segments, home_team, goalie_id):
+    # One row for each player on the ice in each segment, a shift covers the segments that start
+    # from its start up to its end
+    segment_keys = _keys(segments['game_id'], segments['start'])
+    first = np.searchsorted(segment_keys, _keys(shifts['gameId'], shifts['globalStartTime']), 'left')
+    last = np.searchsorted(segment_keys, _keys(shifts['gameId'], shifts['globalEndTime']), 'left')
+
+    counts = last - first
+    shift_pos = np.repeat(np.arange(len(shifts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    players = pd.DataFrame({
+        'segment': np.repeat(first, counts) + offsets,
+        'playerId': shifts['playerId'].to_numpy(dtype=np.int64)[shift_pos],
+        'home': (shifts['teamAbbrev'].to_numpy(dtype=object) == home_team)[shift_pos],
+        'goalie': shifts['playerId'].isin(goalie_id).to_numpy()[shift_pos],
+    })
+    return players.drop_duplicates(['segment', 'playerId'])
+
+
+def _wide(players, n_segments):
+    # Player IDs of each segment in the skater and goalie columns, skaters in order of player ID
+    players = players.sort_values(['segment', 'home', 'goalie', 'playerId'], ascending=[True, False, True, True])
+    players['slot'] = players.groupby(['segment', 'home', 'goalie']).cumcount()
+
+    wide = pd.DataFrame(pd.NA, index=pd.RangeIndex(n_segments), columns=player_cols, dtype='Int64')
+    for home, goalie, cols in [(True, False, home_skater_cols), (True, True, ['home_goalie']),
+                               (False, False, away_skater_cols), (False, True, ['away_goalie'])]:
+        team = players[(players['home'] == home) & (players['goalie'] == goalie) & (players['slot'] < len(cols))]
+        for slot, col in enumerate(cols):
+            rows = team[team['slot'] == slot]
+            wide.loc[rows['segment'].to_numpy(), col] = rows['playerId'].to_numpy()
+
+    # Every player counts toward the hash, including skaters past the listed columns
+    signature = np.zeros(n_segments, dtype=np.uint64)
+    np.add.at(signature, players['segment'].to_numpy(), players['playerId'].to_numpy(dtype=np.uint64) * _hash)
+    wide['players_hash'] = signature
+
+    skaters = players[~players['goalie']]
+    wide['home_skaters'] = np.bincount(skaters.loc[skaters['home'], 'segment'], minlength=n_segments)
+    wide['away_skaters'] = np.bincount(skaters.loc[~skaters['home'], 'segment'], minlength=n_segments)
+    return wide
+
+
+def build_stints(shifts, schedule_map, goalie_id):
+    # One row for each stint with the home and away skaters and goalies as player IDs, the skater
+    # counts, the strength state from the point of view of the home team and the duration in seconds
+    shifts = shifts[shifts['globalEndTime'] > shifts['globalStartTime']]
+    shifts = shifts.sort_values(['gameId', 'globalStartTime'], ignore_index=True)
+
+    segments = _segments(shifts)
+    home_team = shifts['gameId'].map(schedule_map['homeTeam.abbrev']).to_numpy(dtype=object)
+    players = _players(shifts, segments, home_team, goalie_id)
+    segments = pd.concat([segments, _wide(players, len(segments))], axis=1)
+
+    # Segments without any players are breaks in the shift data, such as between periods
+    segments = segments[(segments['home_skaters'] + segments['away_skaters']) > 0]
+
+    # A new stint starts whenever the players change or the previous segment does not end where this
+    # one starts
+    previous = segments.shift(1)
+    changed = (
+        (segments['game_id'] != previous['game_id'])
+        | (segments['start'] != previous['end'])
+        | (segments['players_hash'] != previous['players_hash'])
+    )
+    segments['stint_id'] = changed.cumsum().to_numpy() - 1
+
+    stints = segments.groupby('stint_id').agg(
+        game_id=('game_id', 'first'), start=('start', 'first'), end=('end', 'last'),
+        **{col: (col, 'first') for col in player_cols + ['home_skaters', 'away_skaters']})
+    stints['duration'] = stints['end'] - stints['start']
+    stints['strength_state'] = stints['home_skaters'].astype(str) + 'v' + stints['away_skaters'].astype(str)
+    return stints.reset_index()
+
+
+def event_stints(final_pbp, stints):
+    # Stint ID of each event, events that stop play or end a period belong to the stint ending at the
+    # event and every other event to the stint starting at it. Events outside every stint are left missing
+    if len(stints) == 0:
+        return pd.Series(pd.NA, index=final_pbp.index, name='stint_id', dtype='Int64')
+
+    pbp = final_pbp.sort_values(['game_id', 'game_seconds', 'event_index'])
+    keys = _keys(pbp['game_id'], pbp['game_seconds'])
+    start_keys = _keys(stints['game_id'], stints['start'])
+    end_keys = _keys(stints['game_id'], stints['end'])
+    stop = stop_times(pbp) | pbp['event_type'].isin(events_end).to_numpy()
+
+    # Last stint starting at or before the event, or first stint ending at or after a stop
+    pos = np.where(stop, np.searchsorted(end_keys, keys, 'left'), np.searchsorted(start_keys, keys, 'right') - 1)
+    pos = np.clip(pos, 0, len(stints) - 1)
+    inside = np.where(stop, (start_keys[pos] < keys) & (end_keys[pos] >= keys),
+                      (start_keys[pos] <= keys) & (end_keys[pos] > keys))
+
+    stint_id = pd.array(stints['stint_id'].to_numpy()[pos], dtype='Int64')
+    stint_id[~inside] = pd.NA
+    return pd.Series(stint_id, index=pbp.index, name='stint_id').reindex(final_pbp.index)
@@ -0,0 +1,235 @@
+# ---------------------------------------------------------------------------------------------------
+# Columnar output store. final_pbp, the raw shifts and the Players dimension are written as Parquet
+# datasets partitioned by season and game type, each with an explicit schema. Each game is kept in its
+# own file inside its partition, writing a game that is already stored replaces that file, so
+# incremental runs can append without creating duplicate rows or rewriting the rest of the season.
+# ---------------------------------------------------------------------------------------------------
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from fileio import atomic_write
+from transform import final_dtypes, player_columns, compact_dtypes
+
+# Folder that holds one dataset per table
+output_dir = os.environ.get('NHL_OUTPUT_DIR', 'nhl_data')
+
+# Season type for each game type code in the game ID (the 5th and 6th digits)
+season_type_map = {1: "PRE", 2: "REG", 3: "POST"}
+
+# Categorical columns are stored as dictionaries, players and teams number far fewer than 32767
+category_type = pa.dictionary(pa.int16(), pa.string())
+
+
+def _arrow_type(dtype):
+    return category_type if dtype == 'category' else pa.from_numpy_dtype(np.dtype(str(dtype).lower()))
+
+
+def _compact(schema, dtypes):
+    # Schema with the compact types the columns have in memory, so they are not widened on disk
+    return pa.schema([pa.field(field.name, _arrow_type(dtypes[field.name])) if field.name in dtypes else field
+                      for field in schema])
+
+
+pbp_schema = pa.schema([
+    ('season', pa.int64()), ('game_id', pa.int64()), ('game_date', pa.string()),
+    ('season_type', pa.string()), ('event_index', pa.int64()), ('game_period', pa.int64()),
+    ('game_seconds', pa.int64()), ('clock_time', pa.string()), ('event_type', pa.string()),
+    ('Description', pa.string()), ('event_detail', pa.string()), ('event_zone', pa.string()),
+    ('event_team', pa.string()), ('event_player_1', pa.string()), ('event_player_2', pa.string()),
+    ('event_player_3', pa.string()), ('xC', pa.float64()), ('yC', pa.float64()),
+    *[(f'home_on_{i}', pa.string()) for i in range(1, 8)],
+    *[(f'away_on_{i}', pa.string()) for i in range(1, 8)],
+    ('home_goalie', pa.string()), ('away_goalie', pa.string()), ('home_team', pa.string()),
+    ('away_team', pa.string()), ('home_skaters', pa.int64()), ('away_skaters', pa.int64()),
+    ('home_score', pa.int64()), ('away_score', pa.int64()), ('game_score_state', pa.string()),
+    ('game_strength_state', pa.string()), ('home_zone', pa.string()), ('shot_distance', pa.float64()),
+    ('shot_angle', pa.float64()), ('faceoff_index', pa.int64()), ('faceoff_winner_hand', pa.string()),
+    ('faceoff_winner_pos', pa.string()), ('faceoff_loser_hand', pa.string()),
+    ('faceoff_loser_pos', pa.string()), ('shooter_hand', pa.string()), ('shooter_pos', pa.string()),
+    ('event_player_1_sweater', pa.int64()), ('event_player_2_sweater', pa.int64()),
+    ('penalty_type', pa.string()), ('penalty_duration', pa.float64()),
+])
+pbp_schema = _compact(pbp_schema, dict(final_dtypes, **dict.fromkeys(player_columns, 'category')))
+
+shifts_schema = pa.schema([
+    ('id', pa.int64()), ('gameId', pa.int64()), ('playerId', pa.int64()), ('fullName', pa.string()),
+    ('teamId', pa.int64()), ('teamAbbrev', pa.string()), ('period', pa.int64()),
+    ('shiftNumber', pa.int64()), ('typeCode', pa.int64()), ('detailCode', pa.int64()),
+    ('startTime', pa.string()), ('endTime', pa.string()), ('duration', pa.string()),
+    ('globalStartTime', pa.float64()), ('globalEndTime', pa.float64()),
+    ('season', pa.int64()), ('season_type', pa.string()),
+])
+
+players_schema = pa.schema([
+    ('PlayerID', pa.int64()), ('PlayerName', pa.string()), ('SweaterNumber', pa.int64()),
+    ('BirthCity', pa.string()), ('BirthState', pa.string()), ('BirthCountry', pa.string()),
+    ('Season', pa.string()), ('Team', pa.string()), ('HT', pa.int64()), ('WT', pa.int64()),
+    ('positionCode', pa.string()), ('shootsCatches', pa.string()),
+])
+
+# Same play-by-play schema with the on-ice and event player columns stored as player IDs
+pbp_id_schema = _compact(pbp_schema, dict.fromkeys(player_columns, 'Int32'))
+
+# Expected goals features of each unblocked shot attempt, see features.py
+xg_features_schema = pa.schema([
+    ('feature_version', pa.int64()), ('season', pa.int64()), ('season_type', pa.string()), ('game_id', pa.int64()),
+    ('event_index', pa.int64()), ('game_period', pa.int64()), ('game_seconds', pa.int64()),
+    ('event_team', pa.string()), ('is_home', pa.bool_()), ('event_type', pa.string()), ('goal', pa.bool_()),
+    ('shot_type', pa.string()), ('xC', pa.float64()), ('yC', pa.float64()), ('shot_distance', pa.float64()),
+    ('shot_angle', pa.float64()), ('shooter_hand', pa.string()), ('shooter_pos', pa.string()),
+    ('own_skaters', pa.int64()), ('opposing_skaters', pa.int64()), ('strength_state', pa.string()),
+    ('score_diff', pa.int64()), ('empty_net', pa.bool_()), ('prev_event_type', pa.string()),
+    ('prev_event_team', pa.string()), ('prev_same_team', pa.bool_()), ('prev_xC', pa.float64()),
+    ('prev_yC', pa.float64()), ('seconds_since_last', pa.float64()), ('distance_from_last', pa.float64()),
+    ('speed_from_last', pa.float64()), ('angle_change', pa.float64()), ('rebound', pa.bool_()),
+    ('rush', pa.bool_()), ('complete', pa.bool_()),
+])
+xg_features_schema = _compact(xg_features_schema, dict.fromkeys(
+    ['xC', 'yC', 'shot_distance', 'shot_angle', 'prev_xC', 'prev_yC', 'angle_change'], 'float32'))
+
+# Schema, partition columns and the column identifying the rows that are replaced on each write.
+# Players are replaced one full season at a time since every roster is requested on each run.
+tables = {
+    'final_pbp': (pbp_schema, ['season', 'season_type'], 'game_id'),
+    'shifts': (shifts_schema, ['season', 'season_type'], 'gameId'),
+    'Players': (players_schema, ['Season'], None),
+    'xg_features': (xg_features_schema, ['feature_version', 'season', 'season_type'], 'game_id'),
+}
+
+
+def _partition_type(field):
+    # Partition values are folder names, categorical partition columns are plain strings there
+    return pa.field(field.name, pa.string()) if field.type == category_type else field
+
+
+def _partitioning(name):
+    schema, partition_cols, _ = tables[name]
+    return ds.partitioning(pa.schema([_partition_type(schema.field(col)) for col in partition_cols]), flavor='hive')
+
+
+def _to_table(df, schema):
+    # Strings are passed as Python objects with None for missing values so that columns with no
+    # values at all are still written with the declared type. Categories differ between batches, so
+    # categorical columns are encoded again as dictionaries of the declared type
+    df = df.reindex(columns=schema.names)
+    text = pa.schema([pa.field(field.name, pa.string()) if field.type == category_type else field
+                      for field in schema])
+    for field in text:
+        if pa.types.is_string(field.type):
+            df[field.name] = df[field.name].astype(object).where(df[field.name].notna(), None)
+    return pa.Table.from_pandas(df, schema=text, preserve_index=False).cast(schema)
+
+
+def add_partitions(shifts):
+    # Shifts carry no season columns, derive them from the game ID
+    shifts = shifts.copy()
+    start_year = shifts['gameId'] // 1000000
+    shifts['season'] = start_year * 10000 + start_year + 1
+    shifts['season_type'] = (shifts['gameId'] // 10000 % 100).map(season_type_map)
+    return shifts
+
+
+def _folder(path, partition_cols, values):
+    return os.path.join(path, *[f'{col}={value}' for col, value in zip(partition_cols, values)])
+
+
+def _write_file(table, path):
+    atomic_write(path, table, 'wb', lambda table, f: pq.write_table(table, f))
+
+
+def _game_path(folder, game):
+    return os.path.join(folder, f'game-{game}.parquet')
+
+
+def _split_files(folder, key, games, schema):
+    # Files written before each game had its own file are split into one file for each game the first
+    # time one of their games is written again
+    for file in sorted(os.listdir(folder)):
+        if file.startswith('game-') or not file.endswith('.parquet'):
+            continue
+        path = os.path.join(folder, file)
+        if not pq.read_table(path, columns=[key]).column(key).to_pandas().isin(games).any():
+            continue
+        for game, rows in pq.read_table(path).to_pandas().groupby(key, sort=False):
+            if game not in games:
+                _write_file(_to_table(rows, schema), _game_path(folder, game))
+        os.remove(path)
+
+
+def write(df, name, root=None):
+    # Write the rows into each partition they belong to. Every game is kept in its own file, writing a
+    # game that is already stored replaces only that file, so a run costs the games it writes and not
+    # the size of the season. Tables without a key are replaced one partition at a time
+    root = root or output_dir
+    schema, partition_cols, key = tables[name]
+    path = os.path.join(root, name)
+
+    # Play-by-play built with player_ids holds integer player columns
+    if name == 'final_pbp' and pd.api.types.is_integer_dtype(df['home_on_1']):
+        schema = pbp_id_schema
+
+    # Partition values are in the folder names and are left out of the files
+    schema = pa.schema([field for field in schema if field.name not in partition_cols])
+
+    for values, part in df.groupby(partition_cols, sort=False, observed=True):
+        values = values if isinstance(values, tuple) else (values,)
+        folder = _folder(path, partition_cols, values)
+        os.makedirs(folder, exist_ok=True)
+
+        if key is None:
+            for file in os.listdir(folder):
+                os.remove(os.path.join(folder, file))
+            _write_file(_to_table(part, schema), os.path.join(folder, 'part-0.parquet'))
+            continue
+
+        _split_files(folder, key, part[key].unique(), schema)
+        for game, rows in part.groupby(key, sort=False):
+            _write_file(_to_table(rows, schema), _game_path(folder, game))
+
+
+def _filter(filters):
+    # Filters are given as (column, operator, value) tuples that must all hold
+    if not filters:
+        return None
+    operators = {
+        '=': lambda field, value: field == value,
+        '!=': lambda field, value: field != value,
+        'in': lambda field, value: field.isin(value),
+        '<': lambda field, value: field < value,
+        '<=': lambda field, value: field <= value,
+        '>': lambda field, value: field > value,
+        '>=': lambda field, value: field >= value,
+    }
+    expression = None
+    for col, op, value in filters:
+        condition = operators[op](ds.field(col), value)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read(name, columns=None, filters=None, root=None):
+    # Load a table, only the partitions and columns that are requested are read from disk
+    root = root or output_dir
+    path = os.path.join(root, name)
+    if not os.path.isdir(path):
+        return None
+    expression = filters if isinstance(filters, ds.Expression) else _filter(filters)
+    dataset = ds.dataset(path, format='parquet', partitioning=_partitioning(name))
+    df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    # The play-by-play is read back with the compact types it was built with
+    return compact_dtypes(df) if name == 'final_pbp' else df
+
+
+def read_team_season(team, season, columns=None, root=None):
+    # All play-by-play for one team-season, only that season's partitions are scanned
+    expression = (
+        (ds.field('season') == int(season))
+        & ((ds.field('home_team') == team) | (ds.field('away_team') == team))
+    )
+    return read('final_pbp', columns=columns, filters=expression, root=root)
@@ -0,0 +1,84 @@
+# ---------------------------------------------------------------------------------------------------
+# Streaming pipeline. Each game flows through fetch -> normalize -> transform -> on-ice -> describe
+# on its own and is written out in small batches, so memory stays flat no matter how many seasons
+# are requested.
+# ---------------------------------------------------------------------------------------------------
+import pandas as pd
+
+import store
+from fetch import iter_many, game_url, shift_url, succeeded
+from parse import loads
+from transform import normalize_game, normalize_shifts, transform_shifts, transform_games
+
+# Number of games held in memory before they are written to the output store
+batch_games = 50
+
+
+def iter_games(game_ids, session=None):
+    # Request the play-by-play and shifts for each game together and yield them one game at a time
+    urls = (url for Game in game_ids for url in (game_url(Game), shift_url(Game)))
+    responses = iter_many(urls, session)
+
+    for Game in game_ids:
+        response_game = next(responses)
+        response_shift = next(responses)
+
+        # Games with a request that failed or was not found are skipped, fetch.failed_games lists them
+        game_found = succeeded(game_url(Game), response_game)
+        shift_found = succeeded(shift_url(Game), response_shift)
+        if not (game_found and shift_found):
+            continue
+        yield Game, loads(response_game.content), loads(response_shift.content)
+
+
+def process_game(Game, data_game, data_shift, schedule_map, player_map, goalie_id, player_ids=False,
+                 describe_events=None):
+    # Transform a single game, games that have not started yet have no plays and are skipped
+    pbp = normalize_game(Game, data_game)
+    if pbp.empty:
+        return None, None
+
+    shifts = normalize_shifts(data_shift)
+    if shifts.empty:
+        shifts = pd.DataFrame(columns=['gameId', 'period', 'playerId', 'teamAbbrev', 'startTime', 'endTime'])
+
+    shifts = transform_shifts(shifts, player_map)
+    final_pbp = transform_games(pbp, shifts, schedule_map, player_map, goalie_id, player_ids, describe_events)
+    return final_pbp, shifts
+
+
+def iter_final_pbp(game_ids, schedule_map, player_map, goalie_id, session=None, player_ids=False,
+                   describe_events=None):
+    # Generator of the final play-by-play and shifts for each game
+    for Game, data_game, data_shift in iter_games(game_ids, session):
+        final_pbp, shifts = process_game(Game, data_game, data_shift, schedule_map, player_map, goalie_id,
+                                         player_ids, describe_events)
+        if final_pbp is not None:
+            yield final_pbp, shifts
+
+
+def run(game_ids, schedule_map, player_map, goalie_id, output_dir=None, session=None, player_ids=False,
+        describe_events=None):
+    # Write every game to the output store in batches, returns the number of play-by-play rows written
+    batch_pbp = []
+    batch_shifts = []
+    rows = 0
+
+    def flush():
+        store.write(pd.concat(batch_pbp, ignore_index=True), 'final_pbp', output_dir)
+        store.write(store.add_partitions(pd.concat(batch_shifts, ignore_index=True)), 'shifts', output_dir)
+        batch_pbp.clear()
+        batch_shifts.clear()
+
+    for final_pbp, shifts in iter_final_pbp(game_ids, schedule_map, player_map, goalie_id, session, player_ids,
+                                            describe_events):
+        batch_pbp.append(final_pbp)
+        batch_shifts.append(shifts)
+        rows += len(final_pbp)
+        if len(batch_pbp) >= batch_games:
+            flush()
+
+    if batch_pbp:
+        flush()
+
+    return rows
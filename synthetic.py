@@ -0,0 +1,186 @@
+# ---------------------------------------------------------------------------------------------------
+# Synthetic NHL API payloads. Teams, rosters, schedules, play-by-play and shift charts are generated
+# in the same shape as the API responses so the whole pipeline can be run and timed offline. Every
+# payload is built from a seed, the same arguments always give the same data.
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+
+# Team IDs and abbreviations used for the generated league
+teams = [(1, 'NJD'), (2, 'NYI'), (3, 'NYR'), (4, 'PHI'), (5, 'PIT'), (6, 'BOS'), (7, 'BUF'), (8, 'MTL'),
+         (9, 'OTT'), (10, 'TOR'), (12, 'CAR'), (13, 'FLA'), (14, 'TBL'), (15, 'WSH'), (16, 'CHI'), (17, 'DET')]
+
+# Players on each roster, the last two are goalies and only the first one plays
+roster_size = 20
+skaters = 18
+
+# Event types of the play-by-play and how often each one occurs
+play_types = ['faceoff', 'hit', 'shot-on-goal', 'missed-shot', 'blocked-shot', 'giveaway', 'takeaway',
+              'stoppage', 'goal', 'penalty', 'delayed-penalty', 'failed-shot-attempt']
+play_weights = np.array([12, 14, 18, 10, 10, 6, 5, 12, 2, 4, 1, 1], dtype=float)
+shot_types = ['wrist', 'slap', 'snap', 'backhand']
+
+period_seconds = 1200
+periods = [1, 2, 3]
+
+
+def clock(seconds):
+    return f'{seconds // 60:02d}:{seconds % 60:02d}'
+
+
+def player_id(team_id, number):
+    return 8470000 + team_id * 100 + number
+
+
+def teams_payload():
+    return {'data': [{'id': team_id, 'triCode': triCode} for team_id, triCode in teams]}
+
+
+def roster(team_id, triCode, seed=0):
+    rng = np.random.default_rng(seed + team_id)
+    data_roster = {'forwards': [], 'defensemen': [], 'goalies': []}
+    for number in range(roster_size):
+        position = 'C' if number < 4 else 'L' if number < 8 else 'R' if number < 12 else 'D' if number < skaters else 'G'
+        group = 'forwards' if position in 'CLR' else 'defensemen' if position == 'D' else 'goalies'
+        data_roster[group].append({
+            'id': player_id(team_id, number),
+            'firstName': {'default': triCode.title()}, 'lastName': {'default': f'Player{number}'},
+            'sweaterNumber': number + 2, 'positionCode': position,
+            'shootsCatches': 'L' if rng.random() < 0.6 else 'R',
+            'heightInInches': int(rng.integers(68, 78)), 'weightInPounds': int(rng.integers(170, 230)),
+            'birthCity': {'default': 'City'}, 'birthCountry': 'CAN',
+            'birthStateProvince': {'default': 'ON'},
+        })
+    return data_roster
+
+
+def schedule(season, games, seed=0):
+    # Regular season games between random pairs of teams
+    rng = np.random.default_rng(seed + int(season))
+    schedule_games = []
+    for game in range(games):
+        home, away = rng.choice(len(teams), 2, replace=False)
+        schedule_games.append({
+            'id': int(str(season)[:4]) * 1000000 + 20000 + game + 1, 'season': int(season), 'gameType': 2,
+            'gameDate': f'{str(season)[:4]}-10-10', 'gameState': 'OFF',
+            'homeTeam': {'id': teams[home][0], 'abbrev': teams[home][1]},
+            'awayTeam': {'id': teams[away][0], 'abbrev': teams[away][1]},
+        })
+    return {'games': schedule_games}
+
+
+def game(game_id, home, away, events=300, seed=0):
+    # Play-by-play of a regulation game with events spread evenly over the three periods
+    rng = np.random.default_rng(seed + game_id)
+    weights = play_weights / play_weights.sum()
+    plays = []
+    sort_order = 0
+
+    for period in periods:
+        events_period = [('period-start', 0)]
+        seconds = np.sort(rng.integers(0, period_seconds, events // len(periods)))
+        kinds = rng.choice(play_types, len(seconds), p=weights)
+        events_period += [(str(kind), int(second)) for kind, second in zip(kinds, seconds)]
+        events_period.append(('period-end', period_seconds))
+        if period == periods[-1]:
+            events_period.append(('game-end', period_seconds))
+
+        for kind, second in events_period:
+            sort_order += 1
+            owner, opponent = (home, away) if rng.random() < 0.5 else (away, home)
+            player = lambda team: player_id(team[0], int(rng.integers(0, skaters)))
+
+            details = {'eventOwnerTeamId': owner[0]}
+            if kind not in ('period-start', 'period-end', 'game-end', 'stoppage', 'delayed-penalty'):
+                details['xCoord'] = int(rng.integers(-99, 100))
+                details['yCoord'] = int(rng.integers(-42, 43))
+                details['zoneCode'] = str(rng.choice(['O', 'D', 'N']))
+            if kind == 'faceoff':
+                details.update(winningPlayerId=player(owner), losingPlayerId=player(opponent))
+            elif kind == 'hit':
+                details.update(hittingPlayerId=player(owner), hitteePlayerId=player(opponent))
+            elif kind in ('shot-on-goal', 'missed-shot'):
+                details.update(shootingPlayerId=player(owner), shotType=str(rng.choice(shot_types)))
+            elif kind == 'blocked-shot':
+                details.update(shootingPlayerId=player(opponent), blockingPlayerId=player(owner))
+            elif kind in ('giveaway', 'takeaway'):
+                details.update(playerId=player(owner))
+            elif kind == 'goal':
+                details.update(scoringPlayerId=player(owner), assist1PlayerId=player(owner),
+                               shotType=str(rng.choice(shot_types)))
+                if rng.random() < 0.7:
+                    details['assist2PlayerId'] = player(owner)
+            elif kind == 'penalty':
+                details.update(committedByPlayerId=player(owner), drawnByPlayerId=player(opponent),
+                               descKey='hooking', duration=2, typeCode='MIN')
+
+            plays.append({
+                'eventId': sort_order * 3, 'periodDescriptor': {'number': period, 'periodType': 'REG'},
+                'timeInPeriod': clock(second), 'timeRemaining': clock(period_seconds - second),
+                'situationCode': '1551', 'homeTeamDefendingSide': 'left' if period % 2 else 'right',
+                'typeCode': 500, 'typeDescKey': kind, 'sortOrder': sort_order, 'details': details,
+            })
+
+    season = int(str(game_id)[:4])
+    return {'id': game_id, 'season': season * 10000 + season + 1, 'gameType': int(str(game_id)[4:6]),
+            'gameDate': f'{season}-10-10', 'gameState': 'OFF',
+            'homeTeam': {'id': home[0], 'abbrev': home[1]}, 'awayTeam': {'id': away[0], 'abbrev': away[1]},
+            'plays': plays}
+
+
+def shifts(game_id, home, away, shifts_per_player=12, seed=0):
+    # Shift chart where every skater takes a number of shifts in each period and the starting goalie
+    # plays every period in full
+    rng = np.random.default_rng(seed + game_id + 1)
+    gap = max(period_seconds // max(shifts_per_player, 1), 30)
+    data = []
+    shift_id = game_id * 10000
+
+    for team in (home, away):
+        for period in periods:
+            for number in range(roster_size - 1):
+                if number == skaters:
+                    spans = [(0, period_seconds)]
+                else:
+                    spans = []
+                    start = int(rng.integers(0, gap))
+                    while start < period_seconds and len(spans) < shifts_per_player:
+                        length = int(rng.integers(25, 60))
+                        spans.append((start, min(start + length, period_seconds)))
+                        start += length + int(rng.integers(gap // 2, gap * 3 // 2 + 1))
+
+                for start, end in spans:
+                    shift_id += 1
+                    data.append({
+                        'id': shift_id, 'detailCode': 0, 'duration': clock(end - start), 'endTime': clock(end),
+                        'eventDescription': None, 'eventDetails': None, 'eventNumber': None,
+                        'firstName': team[1].title(), 'gameId': game_id, 'hexValue': '#000000',
+                        'lastName': f'Player{number}', 'period': period, 'playerId': player_id(team[0], number),
+                        'shiftNumber': len(data) + 1, 'startTime': clock(start), 'teamAbbrev': team[1],
+                        'teamId': team[0], 'teamName': team[1], 'typeCode': 517,
+                    })
+
+    rng.shuffle(data)
+    return {'data': data, 'total': len(data)}
+
+
+def _game_seconds(period, time):
+    minutes, seconds = time.split(':')
+    return (period - 1) * period_seconds + int(minutes) * 60 + int(seconds)
+
+
+def live_snapshots(data_game, data_shift, steps=20, shift_delay=60):
+    # Play-by-play and shift charts of a finished game as they would be seen while it is played, at
+    # evenly spaced game times. Shifts are only listed shift_delay seconds after they end, so events
+    # are first seen without some of the players that were on the ice
+    game_length = period_seconds * len(periods)
+    snapshots = []
+    for step in range(1, steps + 1):
+        now = game_length * step // steps
+        final = step == steps
+        plays = [play for play in data_game['plays']
+                 if _game_seconds(play['periodDescriptor']['number'], play['timeInPeriod']) <= now]
+        shifts = [shift for shift in data_shift['data']
+                  if final or _game_seconds(shift['period'], shift['endTime']) + shift_delay <= now]
+        snapshots.append((dict(data_game, gameState='OFF' if final else 'LIVE', plays=plays),
+                          {'data': shifts, 'total': len(shifts)}))
+    return snapshots
@@ -0,0 +1,55 @@
+# ---------------------------------------------------------------------------------------------------
+# Round trip of the final play-by-play through the output store. A few synthetic games are transformed,
+# written and read back, the values and the compact types must come back as they were built.
+# ---------------------------------------------------------------------------------------------------
+import os
+import sys
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+from benchmark import payloads, normalize, maps
+from transform import transform_shifts, transform_games
+
+
+@pytest.fixture(params=[False, True], ids=['names', 'player_ids'])
+def final_pbp(request):
+    rosters, data_schedule, data_games = payloads(4, 120, 6, 0)
+    pbp, shifts = normalize(data_games)
+    schedule_map, player_map, goalie_id = maps(rosters, data_schedule)
+    return transform_games(pbp, transform_shifts(shifts, player_map), schedule_map, player_map, goalie_id,
+                           request.param)
+
+
+def test_round_trip(final_pbp, tmp_path):
+    store.write(final_pbp, 'final_pbp', tmp_path)
+    stored = store.read('final_pbp', root=tmp_path)[final_pbp.columns]
+    stored = stored.sort_values(['game_id', 'game_seconds', 'event_index'])
+
+    assert stored.dtypes.astype(str).to_dict() == final_pbp.dtypes.astype(str).to_dict()
+    # Categories can be listed in another order once read back, missing text comes back as None
+    pd.testing.assert_frame_equal(stored.fillna({'Description': ''}).reset_index(drop=True),
+                                  final_pbp.fillna({'Description': ''}).reset_index(drop=True),
+                                  check_categorical=False)
+
+    # Geometry stays 32 bit on disk and categorical text is dictionary encoded
+    schema = pq.read_schema(next(str(path) for path in tmp_path.rglob('*.parquet')))
+    assert str(schema.field('shot_distance').type) == 'float'
+    assert str(schema.field('game_period').type) == 'int8'
+    assert schema.field('event_team').type.value_type == 'string'
+
+
+def test_rewrite_replaces_games(final_pbp, tmp_path):
+    store.write(final_pbp, 'final_pbp', tmp_path)
+    files = {path: path.stat().st_mtime_ns for path in tmp_path.rglob('*.parquet')}
+    game_id = final_pbp['game_id'].iloc[0]
+    store.write(final_pbp[final_pbp['game_id'] == game_id], 'final_pbp', tmp_path)
+    assert len(store.read('final_pbp', root=tmp_path)) == len(final_pbp)
+
+    # Only the file of the game written again changes
+    changed = [path.name for path in tmp_path.rglob('*.parquet') if files.get(path) != path.stat().st_mtime_ns]
+    assert changed == [f'game-{game_id}.parquet']
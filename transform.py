@@ -0,0 +1,529 @@
+# ---------------------------------------------------------------------------------------------------
+# Transformation of the play-by-play and shift data. Every step only depends on the data for a single
+# game plus the player and schedule maps, so the same functions are used for a full multi-season set
+# or for one game at a time.
+# ---------------------------------------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+import report
+from description import render, source_columns
+from geometry import add_shot_geometry, home_zone, fenwick_shot
+from on_ice import assign_on_ice, home_cols, away_cols
+from parse import play_fields, parse_plays, parse_shifts
+from shift_store import ShiftStore
+
+# Assign shortened names for previous event types
+event_type_map = {
+    "faceoff": "FAC",
+    "blocked-shot": "BLK",
+    "hit": "HIT",
+    "penalty": "PEN",
+    "giveaway": "GIVE",
+    "shot-on-goal": "SHOT",
+    "takeaway": "TAKE",
+    "stoppage": "STOP",
+    "delayed-penalty": "DPEN",
+    "goal": "GOAL",
+    "missed-shot": "MISS",
+    "period-start": "PSTR",
+    "period-end": "PEND",
+    "game-end": "GEND",
+    "shootout-complete": "ENDSO",
+    "failed-shot-attempt": "FSHOT"
+}
+
+# Assign new names to event details
+event_detail_map = {
+    "slap": "SLAP",
+    "snap": "SNAP",
+    "backhand": "BACKHAND",
+    "wrist": "WRIST",
+    "tip-in": "TIP-IN",
+    "wrap-around": "WRAP-AROUND",
+    "deflected": "DEFLECTED",
+    "bat": "BAT",
+    "poke": "POKE",
+    "between-legs": "BETWEEN-LEGS",
+    "cradle": "CRADLE"
+}
+
+# Assign new labels to zone codes
+zone_map = {"N": "Neu", "O": "Off", "D": "Def"}
+
+# Raw play-by-play columns used in the transformation, the fields read by parse.py
+raw_columns = play_fields
+
+# Player attributes joined into the pbp data, for each player ID column the attribute and the new column
+player_joins = {
+    'event_player_1_id': {'PlayerName': 'event_player_1', 'SweaterNumber': 'event_player_1_sweater',
+                          'shootsCatches': 'event_player_1_hand', 'positionCode': 'event_player_1_pos'},
+    'event_player_2_id': {'PlayerName': 'event_player_2', 'SweaterNumber': 'event_player_2_sweater'},
+    'event_player_3_id': {'PlayerName': 'event_player_3', 'SweaterNumber': 'event_player_3_sweater'},
+    'details.winningPlayerId': {'PlayerName': 'faceoff_winner', 'shootsCatches': 'faceoff_winner_hand',
+                                'positionCode': 'faceoff_winner_pos'},
+    'details.losingPlayerId': {'PlayerName': 'faceoff_loser', 'shootsCatches': 'faceoff_loser_hand',
+                               'positionCode': 'faceoff_loser_pos'},
+    'details.committedByPlayerId': {'PlayerName': 'CommittedBy'},
+    'details.drawnByPlayerId': {'PlayerName': 'DrawnBy'},
+}
+
+# Columns that hold players, with player_ids these are kept as player IDs instead of names
+player_columns = ['event_player_1', 'event_player_2', 'event_player_3'] + home_cols + away_cols + [
+    'home_goalie', 'away_goalie']
+
+# Columns that hold team triCodes
+team_columns = ['event_team', 'home_team', 'away_team']
+
+#COLUMNS THAT I WANT TO KEEP
+final_columns = ['season', 'game_id', 'game_date', 'season_type', 'event_index', 'game_period',
+                 'game_seconds', 'clock_time', 'event_type', 'Description', 'event_detail', 'event_zone', 
+                 'event_team', 'event_player_1', 'event_player_2', 'event_player_3', 'xC', 'yC',
+                 'home_on_1', 'home_on_2', 'home_on_3', 'home_on_4', 'home_on_5', 'home_on_6', 'home_on_7',
+                 'away_on_1', 'away_on_2', 'away_on_3', 'away_on_4', 'away_on_5', 'away_on_6', 'away_on_7', 'home_goalie',
+                 'away_goalie', 'home_team', 'away_team', 'home_skaters', 'away_skaters', 'home_score', 'away_score',
+                 'game_score_state', 'game_strength_state', 'home_zone', 'shot_distance', 'shot_angle', 'faceoff_index',
+                 'faceoff_winner_hand', 'faceoff_winner_pos', 'faceoff_loser_hand', 'faceoff_loser_pos', 'shooter_hand', 'shooter_pos']
+
+# Keep the columns needed to render descriptions later with description.render
+final_columns = final_columns + source_columns
+
+# Compact types of the final play-by-play. Low-cardinality text is categorical, clock, period and count
+# columns are small integers and coordinates and shot geometry are 32 bit floats. The types are applied
+# once in finalize, the steps before it build most columns with np.select and merges that would not keep
+# them. Columns that are compared to each other share their categories, see compact_dtypes
+final_dtypes = {
+    'season': 'int32', 'event_index': 'int16', 'game_period': 'int8', 'game_seconds': 'int16',
+    'home_skaters': 'int8', 'away_skaters': 'int8', 'home_score': 'int8', 'away_score': 'int8',
+    'faceoff_index': 'int16', 'xC': 'float32', 'yC': 'float32', 'shot_distance': 'float32',
+    'shot_angle': 'float32', 'penalty_duration': 'float32', 'event_player_1_sweater': 'Int8',
+    'event_player_2_sweater': 'Int8',
+    **dict.fromkeys([
+        'game_date', 'season_type', 'clock_time', 'event_type', 'event_detail', 'event_zone', 'event_team',
+        'home_team', 'away_team', 'game_score_state', 'game_strength_state', 'home_zone', 'faceoff_winner_hand',
+        'faceoff_winner_pos', 'faceoff_loser_hand', 'faceoff_loser_pos', 'shooter_hand', 'shooter_pos',
+        'penalty_type'], 'category'),
+}
+
+
+def normalize_teams(data_teams):
+    return pd.json_normalize(data_teams, "data")
+
+
+def normalize_roster(data_roster, triCode, season):
+    # Flatten the forwards, defensemen and goalies of one team-season roster
+    roster_forwards = pd.json_normalize(data_roster, 'forwards')
+    roster_defensemen = pd.json_normalize(data_roster, 'defensemen')
+    roster_goalies = pd.json_normalize(data_roster, 'goalies')
+    
+    roster_season = pd.concat(
+        [roster_forwards, roster_defensemen, roster_goalies],
+        ignore_index=True)
+    
+    roster_season['Season'] = season
+    roster_season['Team'] = triCode
+    return roster_season
+
+
+def build_players(rosters):
+    # Gather all skaters and goalies for the selected seasons.
+    Players = pd.concat(rosters, ignore_index=True)
+
+    # Players appear once for every team and season, only remove accents once for each unique name
+    Players["firstName"] = Players["firstName.default"].map({name: unidecode(name) for name in Players["firstName.default"].unique()})
+    Players["lastName"] = Players["lastName.default"].map({name: unidecode(name) for name in Players["lastName.default"].unique()})
+
+    Players['PlayerName'] = Players['firstName'] + " " + Players['lastName']
+
+    Player_Cols = ['id', 'PlayerName', 'sweaterNumber', 'birthCity.default',
+                   'birthStateProvince.default', 'birthCountry', 'Season', 'Team',
+                   'heightInInches', 'weightInPounds', 'positionCode', 'shootsCatches', ]
+
+    Players = Players.reindex(columns=Player_Cols)
+
+    Players = Players.rename(columns = {
+        'id':'PlayerID', 'sweaterNumber':'SweaterNumber', 'birthCity.default':'BirthCity',
+        'birthStateProvince.default':'BirthState', 'birthCountry':'BirthCountry',
+        'heightInInches':'HT', 'weightInPounds':'WT'
+    })
+
+    Cols_Convert = ['PlayerID', 'SweaterNumber', 'HT', 'WT']
+
+    Players[Cols_Convert] = Players[Cols_Convert].astype('Int64')
+    return Players
+
+
+def normalize_schedule(data_schedule):
+    return pd.json_normalize(data_schedule, "games")
+
+
+def build_schedule(schedules, game_types=None):
+    # Add data to the empty dataset and drop any duplicate rows that exist for each game
+    schedule = pd.concat(schedules, ignore_index=True)
+    schedule = schedule.drop_duplicates(subset=['id'])
+
+    # Filter out exhibition games, or keep only the requested game types
+    if game_types is None:
+        return schedule[schedule['gameType'] > 1]
+    return schedule[schedule['gameType'].isin(game_types)]
+
+
+def normalize_game(Game, data_game):
+    # Read the fields used from the plays of one game and add the game and season
+    data_game = parse_plays(data_game)
+
+    data_game['game_id'] = Game
+    start_year = int(str(Game)[:4])
+    data_game['season'] = int(f'{start_year}{start_year+1}')
+    return data_game
+
+
+def normalize_shifts(data_shift):
+    return parse_shifts(data_shift)
+
+
+def build_player_map(Players):
+    #Reduce player database to only the unique Player ID values
+    Players_ID = Players.sort_values(['Season','PlayerName'])
+    Players_ID = Players_ID.drop_duplicates(subset = ['PlayerID'], keep = 'last')
+
+    # Join player names into the PBP data using Player ID
+    return Players_ID.set_index('PlayerID')
+
+
+def goalie_ids(player_map):
+    # Filter the player data to only goaltender player Id values
+    return player_map.index[player_map['positionCode'] == 'G'].unique().tolist()
+
+
+def join_players(df, player_map, joins):
+    # Find every player ID from all of the ID columns in the player map in a single lookup, then take
+    # each attribute by position. Players missing from the map are left empty
+    id_cols = list(joins)
+    ids = pd.concat([df[col].astype('Int64') for col in id_cols], ignore_index=True)
+    positions = player_map.index.get_indexer(ids).reshape(len(id_cols), len(df))
+
+    for col, pos in zip(id_cols, positions):
+        for attribute, new_col in joins[col].items():
+            values = player_map[attribute]
+            values = values.array if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) else values.to_numpy()
+            df[new_col] = pd.Series(pd.api.extensions.take(values, pos, allow_fill=True), index=df.index)
+    return df
+
+
+def player_names(ids, player_map):
+    # Categorical player names for a column of player IDs, each name is stored only once
+    names = player_map['PlayerName']
+    categories = pd.Index(names.dropna().unique())
+    codes = categories.get_indexer(names)
+    positions = player_map.index.get_indexer(pd.Series(ids).astype('Int64'))
+    codes = np.where(positions >= 0, codes[positions], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=getattr(ids, 'index', None))
+
+
+def transform_pbp(pbp, schedule_map, player_map):
+    # Create a copy of the original set of pbp data to keep from re-scraping the pbp set as it takes the longest
+    pbp_transform = pbp.copy()
+
+    # Add any columns that are missing from the raw data so every step below can use them
+    for col in raw_columns:
+        if col not in pbp_transform:
+            pbp_transform[col] = np.nan
+
+    # Map columns from schedule data into pbp data
+    pbp_transform['game_type'] = pbp_transform['game_id'].map(schedule_map['gameType'])
+    pbp_transform['game_date'] = pbp_transform['game_id'].map(schedule_map['gameDate'])
+    pbp_transform['home_team'] = pbp_transform['game_id'].map(schedule_map['homeTeam.abbrev'])
+    pbp_transform['home_id'] = pbp_transform['game_id'].map(schedule_map['homeTeam.id'])
+    pbp_transform['away_team'] = pbp_transform['game_id'].map(schedule_map['awayTeam.abbrev'])
+    pbp_transform['away_id'] = pbp_transform['game_id'].map(schedule_map['awayTeam.id'])
+
+    # To perform any time difference of events the game clock will need to be converted to seconds and adjusted for each period
+    pbp_transform['game_seconds'] = pbp_transform['timeInPeriod'].apply(lambda x: int(x.split(':')[0]) * 60 + int(x.split(':')[1]))
+    pbp_transform['game_seconds'] = np.where(pbp_transform['game_type'] != 1, (pbp_transform['periodDescriptor.number'] - 1) * 1200 + pbp_transform['game_seconds'], pbp_transform['game_seconds'])
+
+    pbp_transform['season_type'] = pbp_transform['game_type'].map({1: "PRE", 2: "REG"}).fillna("POST")
+    pbp_transform['clock_time'] = pbp_transform['timeRemaining']
+    pbp_transform['game_period'] = pbp_transform['periodDescriptor.number']
+    pbp_transform['event_team'] = np.where(
+        pbp_transform['details.eventOwnerTeamId'] == pbp_transform['home_id'],
+        pbp_transform['home_team'],
+        pbp_transform['away_team']
+    )
+
+    # Map changes for event types
+    pbp_transform['event_type'] = pbp_transform['typeDescKey'].map(event_type_map)
+
+    # Map changes for event details
+    pbp_transform['event_detail'] = pbp_transform['details.shotType'].map(event_detail_map)
+    pbp_transform['penalty_type'] = pbp_transform['details.descKey']
+    pbp_transform['penalty_duration'] = pbp_transform['details.duration']
+
+    # Assign new labels to zone codes
+    pbp_transform["event_zone"] = pbp_transform["details.zoneCode"].map(zone_map)
+
+    # Create dummy variable for home and away goals
+    pbp_transform["home_goal"] = ((pbp_transform["event_type"] == "GOAL") & 
+                             (pbp_transform["event_team"] == pbp_transform["home_team"])).astype(int)
+    pbp_transform["away_goal"] = ((pbp_transform["event_type"] == "GOAL") & 
+                             (pbp_transform["event_team"] == pbp_transform["away_team"])).astype(int)
+
+    # Create new column for x and y coordinates
+    pbp_transform["xC"] = pbp_transform["details.xCoord"]
+    pbp_transform["yC"] = pbp_transform["details.yCoord"]
+
+    # Create column for Player ID of Player 1 during events
+    pbp_transform["event_player_1_id"] = np.select(
+        [
+            pbp_transform["typeDescKey"] == "goal",
+            pbp_transform["typeDescKey"] == "faceoff",
+            pbp_transform["typeDescKey"].isin(["blocked-shot", "shot-on-goal", "missed-shot"]),
+            pbp_transform["typeDescKey"] == "hit",
+            pbp_transform["typeDescKey"] == "penalty",
+            pbp_transform["typeDescKey"] == "takeaway",
+            pbp_transform["typeDescKey"] == "giveaway",
+        ],
+        [
+            pbp_transform["details.scoringPlayerId"],
+            pbp_transform["details.winningPlayerId"],
+            pbp_transform["details.shootingPlayerId"],
+            pbp_transform["details.hittingPlayerId"],
+            pbp_transform["details.committedByPlayerId"],
+            pbp_transform["details.playerId"],  
+            pbp_transform["details.playerId"],  
+        ],
+        default=np.nan
+    )
+
+    pbp_transform["event_player_1_id"] = pbp_transform["event_player_1_id"].astype("Int64")
+
+    # Create column for Player ID of Player 2 during events
+    pbp_transform["event_player_2_id"] = np.select(
+        [
+            pbp_transform["typeDescKey"] == "goal",
+            pbp_transform["typeDescKey"] == "faceoff",
+            pbp_transform["typeDescKey"] == "blocked-shot",
+            pbp_transform["typeDescKey"] == "hit",
+            pbp_transform["typeDescKey"] == "penalty"
+        ],
+        [
+            pbp_transform["details.assist1PlayerId"],
+            pbp_transform["details.losingPlayerId"],
+            pbp_transform["details.blockingPlayerId"],
+            pbp_transform["details.hitteePlayerId"],
+            pbp_transform["details.drawnByPlayerId"]
+        ],
+        default=np.nan
+    )
+
+    pbp_transform["event_player_2_id"] = pbp_transform["event_player_2_id"].astype("Int64")
+
+    # Create column for Player ID of Player 3 during events
+    pbp_transform["event_player_3_id"] = np.select(
+        [
+            pbp_transform["typeDescKey"] == "goal"
+        ],
+        [
+            pbp_transform["details.assist2PlayerId"]
+        ],
+        default=np.nan
+    )
+
+    pbp_transform["event_player_3_id"] = pbp_transform["event_player_3_id"].astype("Int64")
+
+    # ---------------------------------------------------------------------------------------------------
+    # Begin calculations for distance and angle of shots taken. Coordinates are normalized to the
+    # attacking direction so shots from beyond center ice and from behind the goal need no adjustments.
+    # ---------------------------------------------------------------------------------------------------
+    pbp_transform = add_shot_geometry(pbp_transform)
+
+    # Create a column for player ID that won and lost the faceoff (Will be used to analyze faceoff play at a later time
+    # but could be ommitted at this time from final pbp set
+    pbp_transform['faceoff_winner_id'] = pbp_transform['details.winningPlayerId'].astype("Int64")
+    pbp_transform['faceoff_loser_id'] = pbp_transform['details.losingPlayerId'].astype("Int64")
+
+    # Join the player names, sweaters, hands and positions into the pbp data in one pass
+    pbp_transform = join_players(pbp_transform, player_map, player_joins)
+
+    # Group by Game ID and create running scores for each team during the game
+    pbp_transform["home_score"] = pbp_transform.groupby("game_id")["home_goal"].cumsum()
+    pbp_transform["away_score"] = pbp_transform.groupby("game_id")["away_goal"].cumsum()
+
+    # Create game state for each event of the game, always presented in context of the home team
+    pbp_transform["game_score_state"] = pbp_transform["home_score"].astype(str) + "v" + pbp_transform["away_score"].astype(str)
+
+    pbp_transform['event_index'] = (
+        pbp_transform
+        .groupby(['game_id', 'season'])
+        .cumcount()
+        .add(1)
+    )
+
+    return pbp_transform
+
+
+def transform_shifts(shifts, player_map):
+    # Add full player names to the shift data
+    shifts['fullName'] = shifts['playerId'].map(player_map['PlayerName'])
+
+    # Convert shift start time into seconds
+    shifts["startTimeSeconds"] = pd.to_timedelta(
+        '00:' + shifts['startTime']
+    ).dt.total_seconds()
+
+    # Convert the end time into seconds
+    shifts["endTimeSeconds"] = pd.to_timedelta(
+        '00:' + shifts['endTime']
+    ).dt.total_seconds()
+
+    # Adjust shift start time for each period
+    shifts["globalStartTime"] = (
+        (shifts["period"] - 1) * 20 * 60
+        + shifts["startTimeSeconds"]
+    )
+
+    # Adjust shift end time for each period
+    shifts["globalEndTime"] = (
+        (shifts["period"] - 1) * 20 * 60
+        + shifts["endTimeSeconds"]
+    )
+
+    return shifts
+
+
+def build_full_pbp(pbp_transform, on_ice_df):
+    full_pbp = pd.merge(pbp_transform, on_ice_df, how='outer', on = ['game_id', 'game_period', 'game_seconds', 'event_index'])
+
+    full_pbp["home_skaters"] = (
+        full_pbp[home_cols]
+            .notna()                                                        # ignore NaN values
+            & full_pbp[home_cols].ne(full_pbp["home_goalie"], axis=0).fillna(True)     # not equal to goalie
+    ).sum(axis=1)
+
+    full_pbp["away_skaters"] = (
+        full_pbp[away_cols]
+            .notna()                                                        # ignore NaN values
+            & full_pbp[away_cols].ne(full_pbp["away_goalie"], axis=0).fillna(True)     # not equal to goalie
+    ).sum(axis=1)
+
+    full_pbp["game_strength_state"] = full_pbp["home_skaters"].astype(str) + "v" + full_pbp["away_skaters"].astype(str)
+
+    full_pbp["home_zone"] = home_zone(full_pbp["homeTeamDefendingSide"], full_pbp["xC"])
+
+    full_pbp['faceoff_index'] = (
+        (full_pbp['event_type'] == "FAC")
+        .groupby([full_pbp['game_id'], full_pbp['season']])
+        .cumsum()
+    )
+
+    # Add a row for the handedness of the shooter on the ice
+
+    # When the event_type is equal to a shot map the handedness of the player into the new column
+    fenwick_with_location = (
+        (full_pbp['event_type'].isin(fenwick_shot))
+        & (full_pbp['xC'].notna())
+        & (full_pbp['yC'].notna())
+    )
+    full_pbp['shooter_hand'] = full_pbp['event_player_1_hand'].where(fenwick_with_location)
+    full_pbp['shooter_pos'] = full_pbp['event_player_1_pos'].where(fenwick_with_location)
+
+    # Correct positions to just differentiate between forward and defense
+    full_pbp['shooter_pos'] = np.select(
+        [
+            (full_pbp['shooter_pos'] != 'D') & (full_pbp['shooter_pos'].notna()),
+            (full_pbp['shooter_pos'] == 'D') & (full_pbp['shooter_pos'].notna())
+        ],
+        [
+            'F',
+            'D'
+        ],
+        default=np.nan
+    )
+
+    return full_pbp
+
+
+def describe(full_pbp, describe_events=None):
+    # Add description of each event using columns associated with each event type. Only the event types
+    # in describe_events are described, an empty list skips descriptions for bulk exports
+    full_pbp['Description'] = render(full_pbp, describe_events)
+    return full_pbp
+
+
+def finalize(full_pbp, player_ids=False, compact=True):
+    # With player_ids the event players are kept as player IDs, names can be found with player_names
+    if player_ids:
+        full_pbp = full_pbp.drop(columns=['event_player_1', 'event_player_2', 'event_player_3'])
+        full_pbp = full_pbp.rename(columns={
+            'event_player_1_id': 'event_player_1', 'event_player_2_id': 'event_player_2',
+            'event_player_3_id': 'event_player_3'})
+
+    final_pbp = full_pbp[final_columns].copy()
+    if compact:
+        final_pbp = compact_dtypes(final_pbp)
+    return final_pbp.sort_values(['game_id', 'game_seconds','event_index'])
+
+
+def shared_category(frame, cols):
+    # One categorical type for every value of the columns, so the columns can be compared to each other
+    values = [np.empty(0, dtype=object)]
+    for col in [col for col in cols if col in frame]:
+        column = frame[col]
+        categorical = isinstance(column.dtype, pd.CategoricalDtype)
+        values.append(np.asarray(column.cat.categories if categorical else column.dropna().unique(), dtype=object))
+    return pd.CategoricalDtype(pd.Index(np.concatenate(values)).unique().sort_values())
+
+
+def compact_dtypes(final_pbp):
+    # Apply final_dtypes, player columns are categorical names or nullable player IDs. The team columns
+    # share one set of categories and the player name columns another
+    dtypes = dict(final_dtypes, **dict.fromkeys(team_columns, shared_category(final_pbp, team_columns)))
+    players = [final_pbp[col] for col in player_columns if col in final_pbp]
+    if players and pd.api.types.is_numeric_dtype(players[0]):
+        dtypes.update(dict.fromkeys(player_columns, 'Int32'))
+    else:
+        dtypes.update(dict.fromkeys(player_columns, shared_category(final_pbp, player_columns)))
+    return final_pbp.astype({col: dtype for col, dtype in dtypes.items() if col in final_pbp})
+
+
+def memory_report(before, after):
+    # Memory of each column in MB before and after compact_dtypes, with the total in the last row
+    rows = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'dtype_after': after.dtypes.reindex(before.columns).astype(str),
+        'mb_before': before.memory_usage(index=False, deep=True) / 2**20,
+        'mb_after': after.memory_usage(index=False, deep=True).reindex(before.columns) / 2**20,
+    })
+    rows.loc['total', ['mb_before', 'mb_after']] = rows[['mb_before', 'mb_after']].sum()
+    rows['ratio'] = rows['mb_before'] / rows['mb_after']
+    return rows.round(3)
+
+
+def transform_games(pbp, shifts, schedule_map, player_map, goalie_id, player_ids=False, describe_events=None):
+    # Run every step of the transformation and return the final play-by-play, the shifts must already
+    # have been through transform_shifts or be a memory-mapped store from shift_store.py
+    with report.stage('transform_pbp') as stage:
+        pbp_transform = transform_pbp(pbp, schedule_map, player_map)
+        stage['rows'] = len(pbp_transform)
+
+    # Find the players on the ice for each event using an index of the shifts for each game and period
+    with report.stage('on_ice') as stage:
+        if isinstance(shifts, ShiftStore):
+            on_ice_df = shifts.assign_on_ice(pbp_transform, schedule_map, player_map, goalie_id, player_ids)
+        else:
+            on_ice_df = assign_on_ice(pbp_transform, shifts, goalie_id, player_ids)
+        stage['rows'] = len(on_ice_df)
+
+    with report.stage('full_pbp') as stage:
+        full_pbp = build_full_pbp(pbp_transform, on_ice_df)
+        stage['rows'] = len(full_pbp)
+
+    with report.stage('describe') as stage:
+        full_pbp = describe(full_pbp, describe_events)
+        stage['rows'] = len(full_pbp)
+
+    with report.stage('finalize') as stage:
+        final_pbp = finalize(full_pbp, player_ids)
+        stage['rows'] = len(final_pbp)
+    return final_pbp